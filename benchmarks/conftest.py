@@ -0,0 +1,160 @@
+"""
+Benchmarks of the frame rendering and the annotation callbacks
+
+Run by `pytest benchmarks` (needs pytest-benchmark). The application is configured by environment variables
+when it is imported, so the synthetic dataset is generated and the variables are set before the benchmarks
+are collected.
+"""
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pytest
+
+BUNDLED_PATH = Path(__file__).parents[1] / 'slt' / 'examples' / 'images'
+GEOREF_PATH = BUNDLED_PATH / '201911271130_MSG4_msgce_1160x800_geotiff_hrv.tif'
+GEOREF_SIZE = '1160x800'  # images must have the size of the georeference
+PRODUCTS = ['ir108BT', 'sandwich-BT', 'storm', 'vis-ir']
+# directory of the dataset, the index and the annotations, removed at the end of the run
+_work_path = None
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('slt', 'synthetic dataset of the benchmarks')
+    group.addoption('--bench-frames', type=int, default=8, help='number of frames (default: 8)')
+    group.addoption('--bench-size', default=GEOREF_SIZE, help=f'image size WIDTHxHEIGHT (default: {GEOREF_SIZE})')
+    group.addoption('--bench-georef', help=f'georeferenced image of the size, needed unless it is {GEOREF_SIZE}')
+    group.addoption('--bench-products', type=int, default=4, help='number of products in a frame (default: 4)')
+    group.addoption('--bench-shapes', type=int, default=20, help='number of shapes in a frame (default: 20)')
+    group.addoption('--bench-bundled', action='store_true', help='use the bundled example images instead')
+
+
+def make_dataset(path, n_frames, width, height, n_products, seed=0):
+    """Write JPEG images of cloud-like noise named by the default file mask"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    products = (PRODUCTS + [f'product{k}' for k in range(len(PRODUCTS), n_products)])[:n_products]
+    start = datetime(2021, 8, 20, 12)
+    for n in range(n_frames):
+        frame_datetime = start + n * timedelta(minutes=15)
+        for product in products:
+            # smooth noise compresses like real images, unlike white noise
+            small = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+            image = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+            image.save(path / f'msgce-{width}x{height}.{product}.{frame_datetime:%Y%m%d.%H%M}.0.jpg', quality=90)
+
+
+def pytest_configure(config):
+    global _work_path
+    georef_path = config.getoption('--bench-georef') or GEOREF_PATH
+    if config.getoption('--bench-size') != GEOREF_SIZE and not config.getoption('--bench-georef'):
+        raise pytest.UsageError(f'--bench-size other than {GEOREF_SIZE} needs --bench-georef of that size')
+
+    work_path = _work_path = Path(tempfile.mkdtemp(prefix='slt-benchmarks-'))
+    if config.getoption('--bench-bundled'):
+        data_path = BUNDLED_PATH
+    else:
+        width, height = (int(v) for v in config.getoption('--bench-size').split('x'))
+        data_path = work_path / 'images'
+        data_path.mkdir()
+        make_dataset(data_path, config.getoption('--bench-frames'), width, height, config.getoption('--bench-products'))
+    os.environ['SLT_DATA_PATH'] = str(data_path)
+    os.environ['SLT_GEO_PATH'] = str(georef_path)
+    os.environ['SLT_INDEX_PATH'] = str(work_path / 'index.sqlite')
+    os.environ['SLT_STORE_PATH'] = str(work_path / 'annotations.sqlite')
+    os.environ['SLT_PREFETCH_WINDOW'] = '0'  # no background work distorting the measurements
+
+
+def pytest_unconfigure(config):
+    if _work_path is not None:
+        shutil.rmtree(_work_path, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def slt_app():
+    import slt.app
+
+    return slt.app
+
+
+@pytest.fixture(scope='session')
+def client(slt_app):
+    return slt_app.server.test_client()
+
+
+@pytest.fixture(scope='session')
+def image_dataloader(slt_app):
+    return slt_app.image_dataloader
+
+
+@pytest.fixture(scope='session')
+def shapes(request, image_dataloader):
+    """Random rectangles drawn in the first panel"""
+    from slt.config import color_dict
+
+    rng = np.random.default_rng(1)
+    height, width = image_dataloader[0][0].shape[-2:]
+    colors = list(color_dict.values())
+    shapes = []
+    for n in range(request.config.getoption('--bench-shapes')):
+        x0, y0 = rng.uniform(0, width - 50), rng.uniform(0, height - 50)
+        x1, y1 = x0 + rng.uniform(5, 50), y0 + rng.uniform(5, 50)
+        shapes.append({
+            'editable': True, 'xref': 'x', 'yref': 'y', 'layer': 'above', 'opacity': 1,
+            'line': {'color': colors[n % len(colors)], 'width': 4, 'dash': 'solid'},
+            'fillcolor': 'rgba(0, 0, 0, 0)', 'fillrule': 'evenodd', 'type': 'rect',
+            'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1,
+        })
+    return shapes
+
+
+@pytest.fixture
+def callback(client):
+    """Call a Dash callback through the server as the browser does, returns the response"""
+    def call(outputs, inputs, state=(), changed=None):
+        outputs = [dict(zip(('id', 'property'), output.split('.'))) for output in outputs]
+        payload = {
+            'output': '..' + '...'.join(f'{o["id"]}.{o["property"]}' for o in outputs) + '..'
+            if len(outputs) > 1 else f'{outputs[0]["id"]}.{outputs[0]["property"]}',
+            'outputs': outputs if len(outputs) > 1 else outputs[0],
+            'inputs': [dict(id=i, property=p, value=v) for i, p, v in inputs],
+            'state': [dict(id=i, property=p, value=v) for i, p, v in state],
+            'changedPropIds': [changed or f'{inputs[0][0]}.{inputs[0][1]}'],
+        }
+        response = client.post('/_dash-update-component', json=payload)
+        assert response.status_code in (200, 204), response.data
+        return response
+
+    return call
+
+
+@pytest.fixture
+def measure(benchmark):
+    """
+    Benchmark function and record its peak memory and payload size in the extra info of the benchmark
+
+    `setup` (e.g. clearing of caches) is called before every round, `payload` computes the size
+    of the result in bytes.
+    """
+    def run(function, *args, setup=None, payload=None, rounds=5):
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            result = function(*args)
+            benchmark.extra_info['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        if payload is not None:
+            benchmark.extra_info['payload_bytes'] = payload(result)
+
+        if setup is None:
+            return benchmark(function, *args)
+        return benchmark.pedantic(function, args=args, setup=setup, rounds=rounds)
+
+    return run
@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+SESSION = {'session': 'benchmark', 'starttime': 0}
+
+
+@pytest.fixture(scope='module')
+def georeferencer(slt_app):
+    return slt_app.georeferencer
+
+
+@pytest.fixture(scope='module')
+def image_files(image_dataloader):
+    return {'current': 0, 'n_files': len(image_dataloader)}
+
+
+@pytest.fixture(scope='module')
+def table_rows(shapes, georeferencer):
+    from slt.layouts.annotation_table import shapes_to_table_rows
+
+    return shapes_to_table_rows(shapes, 'benchmark', georeferencer)
+
+
+def payload(response):
+    return len(response.data)
+
+
+def test_shape_to_table_row(measure, shapes, georeferencer):
+    from slt.layouts.annotation_table import shapes_to_table_rows
+
+    measure(shapes_to_table_rows, shapes[:1], 'benchmark', georeferencer)
+
+
+def test_shapes_to_table_rows(measure, shapes, georeferencer):
+    from slt.layouts.annotation_table import shapes_to_table_rows
+
+    measure(shapes_to_table_rows, shapes, 'benchmark', georeferencer)
+
+
+def test_georef_grids(measure, client):
+    measure(client.get, '/georef.bin', payload=payload)
+
+
+def test_send_frame_to_graph(measure, callback, image_files):
+    inputs = [('image-files', 'data', image_files), ('product-selection', 'value', None)]
+    state = [('annotations-store', 'data', SESSION)]
+    callback(['graph-frame.data'], inputs, state)  # rendered frames are cached
+    measure(callback, ['graph-frame.data'], inputs, state, payload=payload)
+
+
+def test_send_figure_to_graph(measure, callback, image_files, table_rows):
+    from slt.config import DEFAULT_ATYPE
+
+    measure(callback, ['graph-shapes.data'],
+            [('annotations-table', 'data', table_rows), ('annotation-type-dropdown', 'value', DEFAULT_ATYPE)],
+            [('image-files', 'data', image_files), ('annotations-store', 'data', SESSION)],
+            payload=payload)
+
+
+def test_send_frame_table_next(measure, callback, image_files):
+    request = {'current': image_files['current'] + 1, 'request': 1}
+    measure(callback, ['frame-table.data', 'image-files.data'], [('frame-request', 'data', request)],
+            [('image-files', 'data', dict(image_files)), ('annotations-store', 'data', SESSION),
+             ('annotator-name-input', 'value', 'benchmark')],
+            payload=payload)
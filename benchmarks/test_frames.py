@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+
+@pytest.fixture(scope='module')
+def ia(slt_app):
+    from slt.layouts import image_annotation
+
+    return image_annotation
+
+
+@pytest.fixture(scope='module')
+def products(image_dataloader):
+    from slt.utils import select_products
+
+    return select_products(image_dataloader)
+
+
+def clear_caches(ia):
+    for cache in (ia.render_cache.memory, ia.frame_cache, ia.level_cache, ia.tile_cache.memory):
+        cache.clear()
+
+
+def test_dl2np(measure, image_dataloader):
+    from slt.utils import dl2np
+
+    images = image_dataloader[0]
+    measure(dl2np, images, payload=lambda result: result.nbytes)
+
+
+def test_decode_frame(measure, ia, image_dataloader, products):
+    measure(ia.get_frame_data, image_dataloader, 0, products, setup=lambda: clear_caches(ia),
+            payload=lambda data: data.nbytes)
+
+
+def test_render_frame_fig(measure, ia, image_dataloader, products):
+    ia.get_frame_data(image_dataloader, 0, products)  # decoded images are cached
+    measure(ia.render_frame_fig, image_dataloader, 0, products, payload=lambda fig: len(fig.to_json()))
+
+
+def test_get_frame_fig_cold(measure, ia, image_dataloader, products):
+    measure(ia.get_frame_fig, image_dataloader, 0, products, setup=lambda: clear_caches(ia),
+            payload=lambda fig: len(json.dumps(fig)))
+
+
+def test_make_facet_fig(measure, ia, image_dataloader, products, shapes):
+    from slt.config import DEFAULT_ATYPE
+
+    ia.get_frame_fig(image_dataloader, 0, products)
+    measure(ia.make_facet_fig, image_dataloader, 0, products, DEFAULT_ATYPE, shapes,
+            payload=lambda fig: len(fig.to_json()))
+
+
+def test_tiles(measure, ia, image_dataloader, products):
+    if ia.get_overview_level(ia.get_frame_shape(image_dataloader, 0, products)) == 0:
+        pytest.skip('images are not downsampled, see SLT_PYRAMID_MAX_PIXELS')
+    viewport = {'x': [0, 300], 'y': [0, 200]}
+    measure(ia.make_tile_images, image_dataloader, 0, products, viewport, setup=lambda: ia.tile_cache.memory.clear(),
+            payload=lambda images: len(json.dumps(images)))
@@ -21,11 +21,16 @@ setuptools.setup(
         'numpy>=1.19',
         'orjson==3.6.3',
         'pandas==1.3.2',
+        'pillow>=8.0',
         'plotly==5.3.1',
         'scikit-image==0.18.3',
         'scipy==1.7.1',
+        'trollsift>=0.5',
         'satellite-dataloader @ git+https://github.com/CHMI-satellite-department/satellite-dataloader@develop#egg=satellite-dataloader'
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     scripts=['bin/slt'],
     include_package_data=True,
     zip_safe=False
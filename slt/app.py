@@ -1,78 +1,162 @@
-import dash
-from dash import html
-import dash_bootstrap_components as dbc
-import numpy as np
+from contextlib import contextmanager
 import os
-from scipy import interpolate
-
-from satdl.datasets import StaticImageFolderDataset
-
-from .utils import dl2np
-
-from .config import _data_path
-from .config import _georef
-from .config import _image_file_mask
-
-from .layouts import navbar
-from .layouts import sidebar
-from .layouts import image_annotation
-from .layouts import annotation_table
-
-image_dataloader = StaticImageFolderDataset(
-    _data_path,
-    file_mask=_image_file_mask,
-    georef=_georef,
-    max_cache=100
-).groupby('datetime', sortby=['datetime', 'product'])
-
-
-external_stylesheets = [dbc.themes.BOOTSTRAP, os.environ.get('SLT_PREFIX', '') + "assets/image_annotation_style.css"]
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets, url_base_pathname=os.environ.get('SLT_PREFIX'))
-
-server = app.server
-
-
-data_h, lat_2d, lon_2d = dl2np(image_dataloader[0])
-lat_2d_interpolator = interpolate.RectBivariateSpline(
-    np.arange(lat_2d.shape[0]),
-    np.arange(lat_2d.shape[1]),
-    lat_2d,
-    kx=1, ky=1  # linear interpolation
-)
-lon_2d_interpolator = interpolate.RectBivariateSpline(
-    np.arange(lon_2d.shape[0]),
-    np.arange(lon_2d.shape[1]),
-    lon_2d,
-    kx=1, ky=1  # linear interpolation
-)
-
-app.layout = html.Div(
-    [
-        navbar.get_layout(app),
-        dbc.Container(
-            [
-                dbc.Row(
-                    [
-                        dbc.Col(image_annotation.get_layout(image_dataloader), md=10),
-                        dbc.Col(sidebar.get_layout(image_dataloader=image_dataloader), md=2),
-                    ],
-                    no_gutters=True, justify="start"
-                ),
-                dbc.Row(
-                    dbc.Col(annotation_table.get_layout(image_dataloader), md=10),
-                    justify="start"),
-
-            ],
-            fluid=True,
-        ),
-    ]
-)
-
-image_annotation.activate_callbacks(app, image_dataloader)
-annotation_table.activate_callbacks(app, image_dataloader, lon_2d_interpolator, lat_2d_interpolator)
-sidebar.activate_callbacks(app, image_dataloader)
-navbar.activate_callbacks(app)
+import sys
+import time
+
+# components of the default application (see create_app), created on the first use of these module attributes
+_components = ('app', 'server', 'image_dataloader', 'georeferencer', 'annotation_store')
+_default_app = None
+
+
+@contextmanager
+def _timed(timings, step):
+    start = time.perf_counter()
+    yield
+    if timings is not None:
+        timings.append((step, time.perf_counter() - start))
+
+
+def create_app(settings=None, timings=None):
+    """
+    Create the Dash application
+
+    `settings` are SLT_* environment variables (e.g. `{'SLT_DATA_PATH': 'images'}`) overriding the environment,
+    the configuration is read once per process, so they apply to the first application only. Heavy packages
+    (satdl, plotly.express) are imported and the first frame is rendered on the first use. Durations of the
+    startup steps are appended to `timings` list as (step, seconds). The image dataset, the georeferencer and
+    the annotation store of the application are in `app.server.extensions['slt']`.
+    """
+    settings = {key: str(value) for key, value in (settings or {}).items()}
+    if 'slt.config' in sys.modules and any(os.environ.get(key) != value for key, value in settings.items()):
+        raise ValueError('settings must be given before the configuration is read by the first application')
+    os.environ.update(settings)
+
+    with _timed(timings, 'import dash'):
+        import dash
+        from dash import html
+        import dash_bootstrap_components as dbc
+
+    with _timed(timings, 'import slt'):
+        from .datasets import IndexedImageDataset
+        from .export import register_export_route
+        from .georef import Georeferencer
+        from .metrics import register_metrics
+        from .store import AnnotationStore
+
+        from .config import _data_path
+        from .config import _geo_path
+        from .config import _image_file_mask
+        from .config import _index_path
+        from .config import METRICS_LOG
+        from .config import _store_path
+
+        from .layouts import navbar
+        from .layouts import sidebar
+        from .layouts import image_annotation
+        from .layouts import annotation_table
+
+    with _timed(timings, 'index of image files'):
+        image_dataloader = IndexedImageDataset(
+            _data_path,
+            file_mask=_image_file_mask,
+            index_path=_index_path,
+        )
+
+    with _timed(timings, 'application'):
+        external_stylesheets = [dbc.themes.BOOTSTRAP,
+                                os.environ.get('SLT_PREFIX', '') + "assets/image_annotation_style.css"]
+        app = dash.Dash(__name__, external_stylesheets=external_stylesheets,
+                        url_base_pathname=os.environ.get('SLT_PREFIX'))
+
+        # lon/lat grids are loaded on the first use
+        georeferencer = Georeferencer(geo_path=_geo_path)
+        annotation_store = AnnotationStore(_store_path)
+        app.server.extensions['slt'] = {
+            'image_dataloader': image_dataloader,
+            'georeferencer': georeferencer,
+            'annotation_store': annotation_store,
+        }
+
+        def serve_layout(initial_frame=True):
+            # layout is created for each page load so that every annotator works in a separate session
+            return html.Div(
+                [
+                    navbar.get_layout(app),
+                    dbc.Container(
+                        [
+                            dbc.Row(
+                                [
+                                    dbc.Col(image_annotation.get_layout(image_dataloader,
+                                                                        initial_frame=initial_frame), md=10),
+                                    dbc.Col(sidebar.get_layout(image_dataloader=image_dataloader), md=2),
+                                ],
+                                no_gutters=True, justify="start"
+                            ),
+                            dbc.Row(
+                                dbc.Col(annotation_table.get_layout(image_dataloader), md=10),
+                                justify="start"),
+
+                        ],
+                        fluid=True,
+                    ),
+                ]
+            )
+
+        # Dash validates callbacks against the components of the layout without the initial frame instead of
+        # calling serve_layout, the frame is rendered on the first page load; just the ids are sent to the browser
+        app.validation_layout = html.Div([type(component)(id=component.id)
+                                          for component in serve_layout(initial_frame=False)._traverse_ids()])
+        app.layout = serve_layout
+
+    with _timed(timings, 'callbacks'):
+        image_annotation.activate_callbacks(app, image_dataloader, annotation_store)
+        annotation_table.activate_callbacks(app, image_dataloader, annotation_store, georeferencer)
+        sidebar.activate_callbacks(app, image_dataloader)
+        navbar.activate_callbacks(app)
+        register_export_route(app, annotation_store, georeferencer)
+        register_metrics(app, log=METRICS_LOG)
+
+    return app
+
+
+def warm_up(app):
+    """
+    Load what the workers forked from a preloaded application share
+
+    The georeference (its lon/lat grids, the grids sent to the browsers and the CRS) and plotly express are
+    otherwise loaded by every worker on the first use.
+    """
+    import plotly.express  # noqa: F401
+
+    from .config import GEOREF_MAX_POINTS
+    from .config import get_projection
+
+    georeferencer = app.server.extensions['slt']['georeferencer']
+    georeferencer.browser_grids(GEOREF_MAX_POINTS)
+    get_projection()
+
+
+def profile_startup(settings=None):
+    """Durations of the startup steps of a worker up to serving the first page as list of (step, seconds)"""
+    timings = []
+    app = create_app(settings, timings=timings)
+    with _timed(timings, 'first page (initial frame)'):
+        app.server.test_client().get(app.config.routes_pathname_prefix + '_dash-layout')
+    return timings
+
+
+def __getattr__(name):
+    global _default_app
+    if name not in _components:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    if _default_app is None:
+        _default_app = create_app()
+    if name == 'app':
+        return _default_app
+    if name == 'server':
+        return _default_app.server
+    return _default_app.server.extensions['slt'][name]
 
 
 def run_dev_app(**kwargs):
-    app.run_server(debug=True, **kwargs)
+    create_app().run_server(debug=True, **kwargs)
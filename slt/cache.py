@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache evicting the least recently used items
+
+    Besides the number of items (`maxsize`, None for unlimited), the cache may be limited by `max_bytes` of its
+    items as measured by `sizeof`, the most recent item is kept even if it alone exceeds the limit. Hits, misses
+    and evictions are counted.
+    """
+
+    def __init__(self, maxsize=128, max_bytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._data[key][0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data[key][1]
+            self._data[key] = (value, size)
+            self._data.move_to_end(key)
+            self.nbytes += size
+            while ((self.maxsize is not None and len(self._data) > self.maxsize)
+                   or (self.max_bytes is not None and self.nbytes > self.max_bytes and len(self._data) > 1)):
+                self.nbytes -= self._data.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+
+class KeyLocks:
+    """Locks of individual keys, so that a cached item is computed only once when requested concurrently"""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def __call__(self, key):
+        with self._lock:
+            lock, users = self._locks.get(key, (threading.Lock(), 0))
+            self._locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._locks[key]
+                if users == 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, users - 1)
+
+
+class FrameRenderCache:
+    """
+    Cache of rendered frames, i.e. figures with encoded facet images but without shapes
+
+    Figures are kept as plain dicts in memory with LRU eviction and, if `cache_path` is given,
+    also as json files on disk so that they survive restarts and are shared by all workers.
+    `namespace` (e.g. the data path) separates on-disk caches of different datasets. `max_bytes` and `sizeof`
+    limit the memory as in LRUCache.
+    """
+
+    def __init__(self, maxsize=32, cache_path=None, namespace='', max_bytes=None, sizeof=None):
+        self.memory = LRUCache(maxsize, max_bytes=max_bytes, sizeof=sizeof)
+        self.cache_path = Path(cache_path) if cache_path is not None else None
+        self.namespace = namespace
+        if self.cache_path is not None:
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, key):
+        digest = hashlib.sha1(f'{self.namespace}:{key}'.encode()).hexdigest()
+        return self.cache_path / f'{digest}.json'
+
+    def __contains__(self, key):
+        return key in self.memory or (self.cache_path is not None and self._file(key).exists())
+
+    def get(self, key):
+        fig = self.memory.get(key)
+        if fig is None and self.cache_path is not None:
+            try:
+                with open(self._file(key), 'r') as f:
+                    fig = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self.memory.put(key, fig)
+        return fig
+
+    def put(self, key, fig, fig_json=None):
+        """Store figure dict, `fig_json` is its already serialized form used for the disk cache"""
+        self.memory.put(key, fig)
+        if self.cache_path is not None:
+            if fig_json is None:
+                fig_json = json.dumps(fig)
+            file = self._file(key)
+            # write to a temporary file first so that other workers never read a partial file
+            tmp_file = file.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_file, 'w') as f:
+                f.write(fig_json)
+            os.replace(tmp_file, file)
@@ -1,10 +1,12 @@
+import functools
+import hashlib
 import os
 from pathlib import Path
-import plotly.express as px
+import plotly.colors
 
-from satdl import utils
-
-DEBUG = True
+DEBUG = os.environ.get('SLT_DEBUG', '').lower() in ('1', 'true', 'yes')
+# log every callback request as a JSON line (see register_metrics)
+METRICS_LOG = os.environ.get('SLT_METRICS_LOG', '').lower() in ('1', 'true', 'yes')
 
 _base_path = Path(__file__).parent
 _assets_path = _base_path / 'assets'
@@ -45,17 +47,81 @@ if not _data_path.exists():
 _geo_path = _base_path / 'examples' / 'images' / '201911271130_MSG4_msgce_1160x800_geotiff_hrv.tif'
 _geo_path = Path(os.environ.get('SLT_GEO_PATH', _geo_path))
 if not _geo_path.exists():
-    raise ValueError(f'data path {_data_path} does not exist')
+    raise ValueError(f'georeference path {_geo_path} does not exist')
+
+
+@functools.lru_cache(maxsize=None)
+def get_projection():
+    """CRS of the georeference, read from its sidecar (see load_projection) on the first use"""
+    from .georef import load_projection
+    return load_projection(_geo_path)
+
+
+_cache_path = os.environ.get('SLT_CACHE_PATH')
+_cache_path = Path(_cache_path) if _cache_path else None
+RENDER_CACHE_SIZE = int(os.environ.get('SLT_RENDER_CACHE_SIZE', 32))  # number of rendered frames kept in memory
+DECODE_CACHE_SIZE = int(os.environ.get('SLT_DECODE_CACHE_SIZE', 8))  # number of decoded frames kept in memory
+# memory of decoded images kept by each process, their downsampled levels, served images, rendered frames and tiles
+# may take a quarter of it each on top
+DECODE_CACHE_BYTES = int(os.environ.get('SLT_DECODE_CACHE_BYTES', 1024 ** 3))
+PREFETCH_WINDOW = int(os.environ.get('SLT_PREFETCH_WINDOW', 2))  # number of frames prefetched in each direction
+DECODE_THREADS = int(os.environ.get('SLT_DECODE_THREADS', 4))  # number of products of a frame decoded at once
+
+# products displayed by default, comma separated (all by default), and number of panels in a row
+_products = os.environ.get('SLT_PRODUCTS')
+DEFAULT_PRODUCTS = _products.split(',') if _products else None
+PANEL_COLUMNS = int(os.environ.get('SLT_PANEL_COLUMNS', 2))
+
+# milliseconds after the last click on Previous/Next before the frame is requested, the first click is sent at once
+NAVIGATION_DEBOUNCE = int(os.environ.get('SLT_NAVIGATION_DEBOUNCE', 300))
 
-_georef = utils.image2xr(_geo_path)
-_projection = _georef.attrs.get('crs', '')
+# number of consecutive frames (ending with the current one) played in a loop and milliseconds per frame
+ANIMATION_WINDOW = int(os.environ.get('SLT_ANIMATION_WINDOW', 4))
+ANIMATION_INTERVAL = int(os.environ.get('SLT_ANIMATION_INTERVAL', 500))
+
+# product matched when propagating shapes to the next frame (the first displayed one by default) and the largest
+# expected displacement of the shapes in pixels
+TRACKING_PRODUCT = os.environ.get('SLT_TRACKING_PRODUCT')
+TRACKING_MARGIN = int(os.environ.get('SLT_TRACKING_MARGIN', 32))
+
+# lon/lat grids are sent to the browser subsampled to at most this number of points, geographic coordinates
+# of the shapes are interpolated there while annotating and recomputed from the full grids on export
+GEOREF_MAX_POINTS = int(os.environ.get('SLT_GEOREF_MAX_POINTS', 512 * 512))
+
+# images larger than this number of pixels are sent downsampled, tiles of finer levels are sent when zooming
+PYRAMID_MAX_PIXELS = int(os.environ.get('SLT_PYRAMID_MAX_PIXELS', 1024 ** 2))
+
+# format of the images sent to the browser: "png" inlines them into the figures, "jpeg" and "webp" re-encode them
+# with IMAGE_QUALITY and "passthrough" sends the original files (when browsers display them), the last three are
+# served as separate images at <prefix>images/
+IMAGE_FORMAT = os.environ.get('SLT_IMAGE_FORMAT', 'png').lower()
+if IMAGE_FORMAT not in ('png', 'jpeg', 'webp', 'passthrough'):
+    raise ValueError(f'unknown image format {IMAGE_FORMAT}')
+IMAGE_QUALITY = int(os.environ.get('SLT_IMAGE_QUALITY', 85))
+# seconds the served images are kept by browsers and proxies, their URLs change with the files
+IMAGE_MAX_AGE = int(os.environ.get('SLT_IMAGE_MAX_AGE', 365 * 24 * 3600))
+# path prefix of the application, i.e. of the URLs of the served images
+URL_PREFIX = os.environ.get('SLT_PREFIX') or '/'
+
+# cache of decoded frames shared by all worker processes
+_shared_cache_path = os.environ.get('SLT_SHARED_CACHE_PATH')
+_shared_cache_path = Path(_shared_cache_path) if _shared_cache_path else None
+SHARED_CACHE_BYTES = int(os.environ.get('SLT_SHARED_CACHE_BYTES', 2 * 1024 ** 3))
+
+_store_path = Path.home() / '.slt' / 'annotations.sqlite'
+_store_path = Path(os.environ.get('SLT_STORE_PATH', _store_path))
 
 _image_file_mask = '{projection}-{resolution}.{product}.{datetime:%Y%m%d.%H%M}.0.jpg'
 _image_file_mask = os.environ.get('SLT_DATA_FILENAME_MASK', _image_file_mask)
 
+# index of the image files, one for each data path
+_index_path = hashlib.sha1(str(_data_path.resolve()).encode()).hexdigest()[:16]
+_index_path = Path.home() / '.slt' / f'frames-{_index_path}.sqlite'
+_index_path = Path(os.environ.get('SLT_INDEX_PATH', _index_path))
+
 NUM_ATYPES = 15
 DEFAULT_FIG_MODE = "layout"
-annotation_colormap = px.colors.qualitative.Light24
+annotation_colormap = plotly.colors.qualitative.Light24
 
 # prepare bijective type<->color mapping
 typ_col_pairs = [
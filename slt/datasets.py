@@ -0,0 +1,58 @@
+from .frame_index import FrameIndex
+
+
+class _FrameAttrs:
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        return {'datetime': self._index.frame_datetime(i)}
+
+
+class IndexedImageDataset:
+    """
+    Frames of images grouped by datetime, looked up in a FrameIndex
+
+    Drop-in replacement of `StaticImageFolderDataset(...).groupby('datetime', sortby=['datetime', 'product'])`
+    which does not enumerate the image files: `dataset[i]` is the list of images of i-th frame ordered
+    by product and `dataset.attrs[i]['datetime']` its datetime. `dataset.load(i, products)` loads only
+    the images of the given products. The images are loaded without georeference, pixel coordinates are
+    converted by the Georeferencer.
+    """
+
+    def __init__(self, data_path, file_mask, index_path):
+        self.index = FrameIndex(data_path, file_mask, index_path)
+        self.attrs = _FrameAttrs(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return self.load(i)
+
+    @property
+    def products(self):
+        """All products of the images"""
+        return self.index.products()
+
+    def load(self, i, products=None):
+        """Images of i-th frame ordered by product, of the given products only if `products` is not None"""
+        if not -len(self) <= i < len(self):
+            raise IndexError(f'frame {i} out of range')
+        i %= len(self)
+        frame_datetime = self.index.frame_datetime(i)
+        return [self.load_file(name, product=product, datetime=frame_datetime)
+                for name, product in self.index.files(i, products)]
+
+    def load_file(self, name, **attrs):
+        """Load single image file with the given attributes"""
+        # file name without fields used as file mask matches just the file
+        from satdl.datasets import StaticImageFolderDataset
+
+        file_mask = name.replace('{', '{{').replace('}', '}}')
+        da = StaticImageFolderDataset(self.index.data_path, file_mask=file_mask)[0]
+        da.attrs.update(attrs)
+        return da
@@ -0,0 +1,175 @@
+import csv
+from datetime import datetime
+import importlib.util
+import io
+import json
+
+import flask
+import numpy as np
+
+from .config import download_columns
+
+export_columns = ['session', 'datetime'] + download_columns
+
+EXPORT_MIMETYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+def export_formats():
+    """Available export formats, parquet needs optional pyarrow"""
+    return [fmt for fmt in EXPORT_MIMETYPES if fmt != 'parquet' or importlib.util.find_spec('pyarrow') is not None]
+
+
+def export_rows(annotation_store, georeferencer, session=None, annotator=None, label=None, start=None, end=None):
+    """
+    Iterate over lists of exported rows (with `export_columns`), one list per annotated frame
+
+    Annotations are read from the store frame by frame and geographic coordinates are recomputed
+    from the pixel coordinates of the shapes.
+    """
+    for frame_session, frame, shapes in annotation_store.annotations(session=session, start=start, end=end):
+        shapes = [sh for sh in shapes
+                  if (annotator is None or sh.get('annotator') == annotator)
+                  and (label is None or sh.get('label') == label)]
+        if not shapes:
+            continue
+
+        x0, y0, x1, y1 = np.array([[float(sh[key]) for key in ['x0', 'y0', 'x1', 'y1']] for sh in shapes]).T
+        xc = (x0 + x1) / 2
+        yc = (y0 + y1) / 2
+        lon, lat = georeferencer.lonlat(np.stack([x0, x1, xc], axis=1), np.stack([y0, y1, yc], axis=1))
+
+        rows = []
+        for n, sh in enumerate(shapes):
+            rows.append({
+                'session': frame_session,
+                'datetime': frame,
+                'annotator': sh.get('annotator'),
+                'label': sh.get('label'),
+                'x0': x0[n].item(),
+                'y0': y0[n].item(),
+                'x1': x1[n].item(),
+                'y1': y1[n].item(),
+                'lat0': lat[n, 0].item(),
+                'lat1': lat[n, 1].item(),
+                'lon0': lon[n, 0].item(),
+                'lon1': lon[n, 1].item(),
+                'x_center': xc[n].item(),
+                'y_center': yc[n].item(),
+                'lat_center': lat[n, 2].item(),
+                'lon_center': lon[n, 2].item(),
+            })
+        yield rows
+
+
+def jsonl_chunks(frame_rows):
+    for rows in frame_rows:
+        yield ''.join(json.dumps(row) + '\n' for row in rows)
+
+
+def csv_chunks(frame_rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=export_columns)
+    writer.writeheader()
+    for rows in frame_rows:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _StreamSink(io.RawIOBase):
+    """Writable file which hands over written bytes instead of keeping them, it remembers just the position"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._position
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_chunks(frame_rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(col, pa.string()) if col in ('session', 'datetime', 'annotator', 'label')
+                        else (col, pa.float64()) for col in export_columns])
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write(rows):
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        return sink.pop()
+
+    batch = []
+    for rows in frame_rows:
+        batch.extend(rows)
+        if len(batch) >= PARQUET_ROW_GROUP_SIZE:
+            yield write(batch)
+            batch = []
+    if batch:
+        yield write(batch)
+    writer.close()
+    yield sink.pop()
+
+
+_export_writers = {
+    'jsonl': jsonl_chunks,
+    'csv': csv_chunks,
+    'parquet': parquet_chunks,
+}
+
+
+def _datetime_arg(args, name):
+    value = args.get(name)
+    return str(datetime.fromisoformat(value)) if value else None
+
+
+def register_export_route(app, annotation_store, georeferencer):
+    """
+    Add route streaming annotations
+
+    GET <prefix>export/annotations.<jsonl|csv|parquet> with optional query parameters session,
+    annotator, label, start and end (ISO datetimes of the first and the last frame).
+    """
+    @app.server.route(app.config.routes_pathname_prefix + 'export/annotations.<fmt>')
+    def export_annotations(fmt):
+        if fmt not in export_formats():
+            flask.abort(404, f'unknown export format {fmt}, available: {", ".join(export_formats())}')
+        args = flask.request.args
+        try:
+            start, end = _datetime_arg(args, 'start'), _datetime_arg(args, 'end')
+        except ValueError as e:
+            flask.abort(400, str(e))
+
+        frame_rows = export_rows(annotation_store, georeferencer,
+                                 session=args.get('session'), annotator=args.get('annotator'),
+                                 label=args.get('label'), start=start, end=end)
+        return flask.Response(
+            flask.stream_with_context(_export_writers[fmt](frame_rows)),
+            mimetype=EXPORT_MIMETYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename=annotations.{fmt}'}
+        )
+
+    return export_annotations
@@ -0,0 +1,151 @@
+from datetime import datetime
+import fnmatch
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+
+import trollsift
+
+
+class FrameIndex:
+    """
+    Persistent index of the image files: file name -> frame datetime and product
+
+    File names are parsed with the trollsift file mask only once and kept in an SQLite sidecar
+    database. The index is refreshed on creation, which just compares the modification time of the data
+    directory when nothing has changed and parses only the new or modified files otherwise. Frames are
+    numbered by their datetime so that a frame is looked up without enumerating the archive. The number of
+    frames and the products are kept in memory.
+    """
+
+    def __init__(self, data_path, file_mask, index_path):
+        self.data_path = Path(data_path)
+        self.file_mask = file_mask
+        self.index_path = Path(index_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._parser = trollsift.Parser(file_mask)
+        self._glob = trollsift.globify(file_mask)
+
+        self._lock = threading.Lock()
+        self._connect()
+        self._con.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._con.execute('CREATE TABLE IF NOT EXISTS files ('
+                          'name TEXT PRIMARY KEY, mtime REAL NOT NULL, datetime TEXT NOT NULL, product TEXT NOT NULL)')
+        self._con.execute('CREATE INDEX IF NOT EXISTS files_datetime ON files (datetime, product)')
+        self._con.execute('CREATE TABLE IF NOT EXISTS frames (n INTEGER PRIMARY KEY, datetime TEXT UNIQUE NOT NULL)')
+        self.refresh()
+
+    def _connect(self):
+        self._con = sqlite3.connect(self.index_path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._pid = os.getpid()
+
+    def _query(self, sql, params=()):
+        # the connection is shared by the threads of the process, forked processes (e.g. workers
+        # of preloaded application) open their own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connect()
+            return self._con.execute(sql, params).fetchall()
+
+    def _meta(self, key):
+        rows = self._query('SELECT value FROM meta WHERE key = ?', (key,))
+        return rows[0][0] if rows else None
+
+    def _set_meta(self, key, value):
+        self._con.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def refresh(self):
+        """Update the index with the files added, modified or removed since the last refresh"""
+        dir_mtime = str(self.data_path.stat().st_mtime_ns)
+        products = self._meta('products')
+        if (self._meta('dir_mtime') == dir_mtime and self._meta('file_mask') == self.file_mask
+                and products is not None):
+            self._n_frames = int(self._meta('n_frames'))
+            self._products = json.loads(products)
+            return
+
+        # the lock makes other processes (e.g. workers starting at the same time) wait for the refresh
+        self._con.execute('BEGIN IMMEDIATE')
+        try:
+            if self._meta('file_mask') != self.file_mask:
+                self._con.execute('DELETE FROM files')
+            indexed = dict(self._con.execute('SELECT name, mtime FROM files'))
+            present = set()
+            with os.scandir(self.data_path) as entries:
+                for entry in entries:
+                    if not fnmatch.fnmatchcase(entry.name, self._glob) or not entry.is_file():
+                        continue
+                    present.add(entry.name)
+                    mtime = entry.stat().st_mtime
+                    if indexed.get(entry.name) == mtime:
+                        continue
+                    try:
+                        attrs = self._parser.parse(entry.name)
+                    except ValueError:
+                        continue
+                    self._con.execute(
+                        'INSERT OR REPLACE INTO files (name, mtime, datetime, product) VALUES (?, ?, ?, ?)',
+                        (entry.name, mtime, str(attrs['datetime']), str(attrs.get('product', '')))
+                    )
+            self._con.executemany('DELETE FROM files WHERE name = ?', ((name,) for name in indexed.keys() - present))
+
+            # number the frames (rowid of an emptied table starts from 1 again)
+            self._con.execute('DELETE FROM frames')
+            self._con.execute('INSERT INTO frames (datetime) SELECT DISTINCT datetime FROM files ORDER BY datetime')
+            self._n_frames = self._con.execute('SELECT COUNT(*) FROM frames').fetchone()[0]
+            self._products = [product for product, in
+                              self._con.execute('SELECT DISTINCT product FROM files ORDER BY product')]
+
+            self._set_meta('file_mask', self.file_mask)
+            self._set_meta('dir_mtime', dir_mtime)
+            self._set_meta('n_frames', self._n_frames)
+            self._set_meta('products', json.dumps(self._products))
+            self._con.execute('COMMIT')
+        except BaseException:
+            self._con.execute('ROLLBACK')
+            raise
+
+    def __len__(self):
+        return self._n_frames
+
+    def timestamp(self, i: int) -> str:
+        """Datetime of i-th frame as a string"""
+        if not 0 <= i < self._n_frames:
+            raise IndexError(f'frame {i} out of range')
+        return self._query('SELECT datetime FROM frames WHERE n = ?', (i + 1,))[0][0]
+
+    def frame_datetime(self, i: int) -> datetime:
+        return datetime.fromisoformat(self.timestamp(i))
+
+    def index(self, timestamp: str) -> int:
+        """Number of frame with the given datetime"""
+        rows = self._query('SELECT n FROM frames WHERE datetime = ?', (str(timestamp),))
+        if not rows:
+            raise KeyError(timestamp)
+        return rows[0][0] - 1
+
+    def nearest(self, timestamp) -> int:
+        """Number of frame nearest to the given datetime"""
+        if not self._n_frames:
+            raise KeyError(timestamp)
+        rows = self._query('SELECT n FROM frames ORDER BY abs(julianday(datetime) - julianday(?)), n LIMIT 1',
+                           (str(timestamp),))
+        return rows[0][0] - 1
+
+    def files(self, i: int, products=None):
+        """List of (file name, product) of i-th frame ordered by product, optionally of the given products only"""
+        rows = self._query('SELECT name, product FROM files WHERE datetime = ? ORDER BY product', (self.timestamp(i),))
+        if products is not None:
+            rows = [(name, product) for name, product in rows if product in products]
+        return rows
+
+    def products(self):
+        """Sorted list of all products in the index"""
+        return list(self._products)
+
+    def file(self, name):
+        """(datetime, product, modification time) of the image file, None if it is not in the index"""
+        rows = self._query('SELECT datetime, product, mtime FROM files WHERE name = ?', (name,))
+        return rows[0] if rows else None
@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import math
+import os
+from pathlib import Path
+import threading
+
+import numpy as np
+
+
+def _sidecars(geo_path, cache_path=None):
+    """Paths of the lon/lat grids and the CRS sidecars of georeferenced image"""
+    geo_path = Path(geo_path)
+    stat = geo_path.stat()
+    sidecar_dir = Path(cache_path) if cache_path is not None else geo_path.parent
+    name = f'{geo_path.name}.{stat.st_mtime_ns}-{stat.st_size}'
+    return sidecar_dir / f'{name}.lonlat.npy', sidecar_dir / f'{name}.crs'
+
+
+def _read_georef(geo_path, cache_path=None):
+    """Read lon/lat grids and CRS of georeferenced image and save them to the sidecars, returns (grids, crs)"""
+    from satdl import utils
+
+    geo_path = Path(geo_path)
+    georef = utils.image2xr(geo_path)
+    grids = np.stack([np.asarray(georef.lon, dtype=float), np.asarray(georef.lat, dtype=float)])
+    crs = str(georef.attrs.get('crs', ''))
+
+    sidecar, crs_sidecar = _sidecars(geo_path, cache_path)
+    try:
+        sidecar.parent.mkdir(parents=True, exist_ok=True)
+        for pattern in (f'{geo_path.name}.*.lonlat.npy', f'{geo_path.name}.*.crs'):
+            for old_sidecar in sidecar.parent.glob(pattern):
+                # the current ones may have been just written by another process
+                if old_sidecar not in (sidecar, crs_sidecar):
+                    try:
+                        old_sidecar.unlink()
+                    except FileNotFoundError:
+                        pass
+        tmp_file = crs_sidecar.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_file.write_text(crs)
+        tmp_file.replace(crs_sidecar)
+        tmp_file = sidecar.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_file, 'wb') as f:
+            np.save(f, grids)
+        tmp_file.replace(sidecar)
+    except OSError:  # e.g. read-only directory, just do not cache
+        pass
+    return grids, crs
+
+
+def load_lonlat_grids(geo_path, cache_path=None):
+    """
+    Load lon/lat grids of georeferenced image as read-only memory map of shape (2, rows, columns)
+
+    The grids are computed from the image only once and cached to a .npy sidecar next to the image
+    (or in `cache_path` if given). The sidecar name contains the modification time and the size of
+    the image, so that it is recomputed whenever the image changes.
+    """
+    sidecar = _sidecars(geo_path, cache_path)[0]
+    try:
+        return np.load(sidecar, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+
+    grids = _read_georef(geo_path, cache_path)[0]
+    try:
+        return np.load(sidecar, mmap_mode='r')
+    except (OSError, ValueError):  # not cached or removed meanwhile
+        return grids
+
+
+def load_projection(geo_path, cache_path=None):
+    """CRS of georeferenced image as a string, cached to a sidecar along with the lon/lat grids"""
+    crs_sidecar = _sidecars(geo_path, cache_path)[1]
+    try:
+        return crs_sidecar.read_text()
+    except OSError:
+        return _read_georef(geo_path, cache_path)[1]
+
+
+class Georeferencer:
+    """
+    Convert pixel coordinates of the images to lon/lat
+
+    Coordinates are bilinearly interpolated in the lon/lat grids of the images, which is
+    the same as linear `RectBivariateSpline` but done for whole batches of points at once.
+    Points outside of the grid get the coordinates of the nearest edge.
+
+    The grids are given either directly or as georeferenced file loaded on the first use (see load_lonlat_grids).
+    """
+
+    def __init__(self, lat_2d=None, lon_2d=None, geo_path=None, cache_path=None):
+        self._grids = None
+        if lat_2d is not None and lon_2d is not None:
+            self._grids = np.stack([np.asarray(lon_2d, dtype=float), np.asarray(lat_2d, dtype=float)])
+        elif geo_path is None:
+            raise ValueError('either lat_2d and lon_2d or geo_path must be given')
+        self.geo_path = geo_path
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._browser_grids = {}
+
+    @property
+    def grids(self):
+        if self._grids is None:
+            with self._lock:
+                if self._grids is None:
+                    self._grids = load_lonlat_grids(self.geo_path, cache_path=self.cache_path)
+        return self._grids
+
+    @property
+    def shape(self):
+        return self.grids.shape[1:]
+
+    def browser_grids(self, max_points=512 * 512):
+        """
+        Lon/lat grids for the browser as (gzipped content, version) with at most `max_points` points each
+
+        The content is a header of int32 (rows, columns, grid rows, grid columns) followed by float32 lon and lat
+        grids interpolated at evenly spaced rows and columns including the edges, the version is a hash of the
+        content.
+        """
+        if max_points not in self._browser_grids:
+            n_rows, n_cols = self.shape
+            step = max(math.sqrt(n_rows * n_cols / max_points), 1)
+            rows = np.linspace(0, n_rows - 1, max(math.floor(n_rows / step), min(n_rows, 2)))
+            cols = np.linspace(0, n_cols - 1, max(math.floor(n_cols / step), min(n_cols, 2)))
+            grids = np.stack(self.lonlat(cols[None, :], rows[:, None])).astype('<f4')
+            header = np.array((n_rows, n_cols) + grids.shape[1:], dtype='<i4')
+            content = gzip.compress(header.tobytes() + grids.tobytes(), compresslevel=6)
+            self._browser_grids[max_points] = (content, hashlib.sha1(content).hexdigest()[:20])
+        return self._browser_grids[max_points]
+
+    def lonlat(self, x, y):
+        """Interpolate lon and lat of points with pixel coordinates x (column) and y (row) of any shape"""
+        n_rows, n_cols = self.shape
+        x = np.clip(np.asarray(x, dtype=float), 0, n_cols - 1)
+        y = np.clip(np.asarray(y, dtype=float), 0, n_rows - 1)
+        # indices of the upper-left corners of grid cells containing the points
+        j = np.minimum(np.floor(x).astype(int), max(n_cols - 2, 0))
+        i = np.minimum(np.floor(y).astype(int), max(n_rows - 2, 0))
+        j1 = np.minimum(j + 1, n_cols - 1)
+        i1 = np.minimum(i + 1, n_rows - 1)
+        fx = x - j
+        fy = y - i
+
+        g = self.grids
+        lonlat = (g[:, i, j] * (1 - fy) * (1 - fx) + g[:, i1, j] * fy * (1 - fx)
+                  + g[:, i, j1] * (1 - fy) * fx + g[:, i1, j1] * fy * fx)
+        return lonlat[0], lonlat[1]
@@ -0,0 +1,47 @@
+import base64
+import io
+import mimetypes
+
+import numpy as np
+from PIL import Image
+
+# formats of the images sent to the browser, "original" are the image files as they are
+MIME_TYPES = {'png': 'image/png', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+# image files which browsers display without re-encoding
+BROWSER_TYPES = {'image/png', 'image/jpeg', 'image/webp', 'image/gif'}
+
+
+def encode_image(data, fmt='png', quality=85):
+    """
+    Encode image (rows, columns) or (rows, columns, channels) of uint8 into bytes of the given format
+
+    `quality` applies to the lossy formats, JPEG images lose their alpha channel.
+    """
+    data = np.asarray(data)
+    if data.ndim == 3 and data.shape[-1] == 1:
+        data = data[..., 0]
+    image = Image.fromarray(np.ascontiguousarray(data))
+    if fmt == 'jpeg' and image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    stream = io.BytesIO()
+    if fmt == 'png':
+        image.save(stream, format='PNG', compress_level=4)
+    else:
+        image.save(stream, format=fmt.upper(), quality=quality)
+    return stream.getvalue()
+
+
+def image_size(path):
+    """(rows, columns) of image file read from its header without decoding the image"""
+    with Image.open(path) as image:
+        return image.size[::-1]
+
+
+def to_data_uri(content, mime_type):
+    return f'data:{mime_type};base64,' + base64.b64encode(content).decode()
+
+
+def passthrough_type(name):
+    """MIME type of image file if it can be sent to the browser as it is, otherwise None"""
+    mime_type = mimetypes.guess_type(name)[0]
+    return mime_type if mime_type in BROWSER_TYPES else None
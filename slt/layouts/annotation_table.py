@@ -4,14 +4,24 @@ from dash import dcc
 from dash import html
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
-import re
+from datetime import datetime
+import flask
+import numpy as np
+from urllib.parse import urlencode
+import uuid
 
+from ..tracking import propagate_shapes
 from ..utils import frame_timestamp, time_passed
+from ..utils import select_products
+from .image_annotation import get_product_data
+from .image_annotation import latest_requests
 
 from ..config import annotation_types, columns
-from ..config import color_dict
-from ..config import download_columns
+from ..config import GEOREF_MAX_POINTS
+from ..config import TRACKING_MARGIN
+from ..config import TRACKING_PRODUCT
 from ..config import type_dict
+from ..config import URL_PREFIX
 
 
 def get_layout(image_dataloader):
@@ -57,29 +67,23 @@ def get_layout(image_dataloader):
                                     ],
                                     fill_width=True,
                                 ),
+                                # annotations are kept on the server (see AnnotationStore), the browser
+                                # holds just the session they belong to
                                 dcc.Store(
                                     id="annotations-store",
-                                    data=dict(
-                                        **{
-                                            frame_timestamp(image_dataloader, i): {"shapes": []}
-                                            for i in range(len(image_dataloader))
-                                        },
-                                        **{"starttime": time_passed()}
-                                    ),
-                                ),
-                                dcc.Store(
-                                    id="download-store",
-                                    data=dict(
-                                        **{
-                                            frame_timestamp(image_dataloader, i): {"shapes": []}
-                                            for i in range(len(image_dataloader))
-                                        }
-                                    ),
+                                    data={"session": uuid.uuid4().hex, "starttime": time_passed()},
                                 ),
                                 dcc.Store(
                                     id="image-files",
                                     data={"current": 0, "n_files": len(image_dataloader)},
                                 ),
+                                # rows of the table of a newly shown frame, the rows are then updated in the
+                                # browser while annotating
+                                dcc.Store(id="frame-table"),
+                                dcc.Store(
+                                    id="annotations-table-config",
+                                    data={"georef": URL_PREFIX + "georef.bin", "labels": type_dict},
+                                ),
                             ],
                         ),
                     ),
@@ -91,168 +95,209 @@ def get_layout(image_dataloader):
     )
 
 
-def activate_callbacks(app, image_dataloader, lon_interpolator, lat_interpolator):
+def activate_callbacks(app, image_dataloader, annotation_store, georeferencer):
     @app.callback(
-        Output("download-store", "data"),
-        Input("annotations-store", "data")
-    )
-    def convert_download_data(annotations_data):
-        def filter_download_fields(fields):
-            return [{k: v for k, v in field.items() if k in download_columns}
-                    for field in fields]
-        return {k: filter_download_fields(v.get('shapes', [])) for k, v in annotations_data.items() if k != "starttime"}
-
-    # set the download url to the contents of the annotations-store (so they can be
-    # downloaded from the browser's memory)
-    app.clientside_callback(
-        """
-    function(the_store_data) {
-        let s = JSON.stringify(the_store_data);
-        let b = new Blob([s],{type: 'text/plain'});
-        let url = URL.createObjectURL(b);
-        return url;
-    }
-    """,
-        Output("download", "href"),
-        [Input("download-store", "data")],
+        Output("download-button", "href"),
+        [Input("download-format", "value"), Input("annotations-store", "data")]
     )
+    def update_download_link(download_format, annotations_data):
+        # annotations of the session are streamed by the export route (see register_export_route)
+        query = urlencode({"session": annotations_data["session"]})
+        return app.get_relative_path(f"/export/annotations.{download_format}") + "?" + query
 
-    # click on download link via button
-    app.clientside_callback(
-        """
-    function(download_button_n_clicks)
-    {
-        let download_a=document.getElementById("download");
-        download_a.click();
-        return '';
-    }
-    """,
-        Output("dummy", "children"),
-        [Input("download-button", "n_clicks")],
-    )
+    @app.server.route(app.config.routes_pathname_prefix + 'georef.bin')
+    def georef_route():
+        content, version = georeferencer.browser_grids(GEOREF_MAX_POINTS)
+        response = flask.Response(content, mimetype='application/octet-stream')
+        response.headers['Content-Encoding'] = 'gzip'
+        # the browser keeps the grids and revalidates them by the ETag
+        response.set_etag(version)
+        response.cache_control.no_cache = True
+        return response.make_conditional(flask.request)
 
     @app.callback(
-        [Output("annotations-table", "data"), Output("image-files", "data")],
+        [Output("frame-table", "data"), Output("image-files", "data")],
+        [Input("frame-request", "data")],
         [
-            Input("previous", "n_clicks"),
-            Input("next", "n_clicks"),
-            Input("graph", "relayoutData"),
-        ],
-        [
-            State("annotations-table", "data"),
             State("image-files", "data"),
             State("annotations-store", "data"),
-            # State("annotation-type-dropdown", "value"),
             State("annotator-name-input", "value"),
         ],
+        prevent_initial_call=True,
     )
-    def modify_table_entries(
-            previous_n_clicks,
-            next_n_clicks,
-            graph_relayout_data,
-            annotations_table_data,
-            image_files_data,
-            annotations_store_data,
-            # annotation_type,
-            annotator_name,
-    ):
-        cbcontext = [p["prop_id"] for p in dash.callback_context.triggered][0]
-        if cbcontext == "graph.relayoutData":
-            if "shapes" in graph_relayout_data.keys():
-                # this means all the shapes have been passed to this function via
-                # graph_relayout_data, so we store them
-                annotations_table_data = [
-                    shape_to_table_row(sh, annotator_name,
-                                       lon_interpolator=lon_interpolator,
-                                       lat_interpolator=lat_interpolator)
-                    for sh in graph_relayout_data["shapes"]
-                ]
-                # add annotator
-            elif re.match(r"shapes\[[0-9]+\].x0", list(graph_relayout_data.keys())[0]):
-                # this means a shape was updated (e.g., by clicking and dragging its
-                # vertices), so we just update the specific shape
-                annotations_table_data = annotations_table_shape_resize(
-                    annotations_table_data, graph_relayout_data,
-                    lon_interpolator=lon_interpolator,
-                    lat_interpolator=lat_interpolator
-                )
-            if annotations_table_data is None:
-                return dash.no_update
-            else:
-                return annotations_table_data, image_files_data
-        image_index_change = 0
-        if cbcontext == "previous.n_clicks":
-            image_index_change = -1
-        if cbcontext == "next.n_clicks":
-            image_index_change = 1
-        image_files_data["current"] += image_index_change
-        image_files_data["current"] %= image_files_data["n_files"]
-        if image_index_change != 0:
-            # image changed, update annotations_table_data with new data
-            annotations_table_data = []
-            for sh in annotations_store_data[frame_timestamp(image_dataloader, image_files_data["current"])]["shapes"]:
-                annotations_table_data.append(shape_to_table_row(sh,
-                                                                 annotator_name,
-                                                                 lon_interpolator=lon_interpolator,
-                                                                 lat_interpolator=lat_interpolator))
-            return annotations_table_data, image_files_data
-        else:
+    def send_frame_table(frame_request, image_files_data, annotations_store_data, annotator_name):
+        index = requested_frame(image_dataloader, frame_request)
+        if index is None or latest_requests.superseded(annotations_store_data["session"], frame_request["request"]):
             return dash.no_update
+        # the callbacks of frames requested before are dropped (see LatestRequests)
+        latest_requests.put(annotations_store_data["session"], frame_request["request"])
+        image_files_data.update(current=index, request=frame_request["request"])
+        shapes = annotation_store.get(annotations_store_data["session"], frame_timestamp(image_dataloader, index))
+        if frame_request.get("propagate") and not shapes:
+            # propose shapes of the previous frame moved with the clouds, they are stored as new shapes
+            # of the frame when the table is updated
+            previous_index = (index - 1) % len(image_dataloader)
+            product = select_products(image_dataloader, [TRACKING_PRODUCT] if TRACKING_PRODUCT else None)[0]
+            shapes = propagate_shapes(
+                annotation_store.get(annotations_store_data["session"],
+                                     frame_timestamp(image_dataloader, previous_index)),
+                get_product_data(image_dataloader, previous_index, product),
+                get_product_data(image_dataloader, index, product),
+                margin=TRACKING_MARGIN,
+            )
+        return shapes_to_table_rows(shapes, annotator_name, georeferencer=georeferencer), image_files_data
 
+    # rows of the table are set from the frame table sent by the server and from the shapes drawn or moved
+    # in the graph, their geographic coordinates are interpolated in the lon/lat grids loaded once by the
+    # browser (see Georeferencer.browser_grids) and are left empty until the grids arrive
+    app.clientside_callback(
+        """
+    function(frame_table, relayout, rows, annotator, config) {
+        const no_update = window.dash_clientside.no_update;
+        if (config.georef && window.slt_georef === undefined) {
+            window.slt_georef = null;
+            fetch(config.georef).then(response => response.arrayBuffer()).then(buffer => {
+                const header = new Int32Array(buffer, 0, 4);
+                const size = header[2] * header[3];
+                window.slt_georef = {
+                    rows: header[2], cols: header[3],
+                    // grid points per pixel of the images
+                    x_scale: (header[3] - 1) / Math.max(header[1] - 1, 1),
+                    y_scale: (header[2] - 1) / Math.max(header[0] - 1, 1),
+                    lon: new Float32Array(buffer, 16, size), lat: new Float32Array(buffer, 16 + 4 * size, size),
+                };
+            }).catch(() => { window.slt_georef = undefined; });
+        }
+        const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+        if (triggered.includes("frame-table.data")) {
+            return frame_table;
+        }
+        if (!triggered.includes("graph.relayoutData") || !relayout) {
+            return no_update;
+        }
 
-def coord_to_tab_column(coord):
-    return coord.upper()
+        // bilinear interpolation as in Georeferencer.lonlat
+        const lonlat = (x, y) => {
+            const g = window.slt_georef;
+            if (!g) {
+                return [null, null];
+            }
+            const gx = Math.min(Math.max(x * g.x_scale, 0), g.cols - 1);
+            const gy = Math.min(Math.max(y * g.y_scale, 0), g.rows - 1);
+            const j = Math.min(Math.floor(gx), Math.max(g.cols - 2, 0));
+            const i = Math.min(Math.floor(gy), Math.max(g.rows - 2, 0));
+            const j1 = Math.min(j + 1, g.cols - 1);
+            const i1 = Math.min(i + 1, g.rows - 1);
+            const fx = gx - j;
+            const fy = gy - i;
+            const at = grid => grid[i * g.cols + j] * (1 - fy) * (1 - fx) + grid[i1 * g.cols + j] * fy * (1 - fx)
+                               + grid[i * g.cols + j1] * (1 - fy) * fx + grid[i1 * g.cols + j1] * fy * fx;
+            return [at(g.lon), at(g.lat)];
+        };
+        const new_id = () => Array.from(crypto.getRandomValues(new Uint8Array(16)),
+                                        b => b.toString(16).padStart(2, "0")).join("");
+        // see shapes_to_table_rows
+        const to_row = (sh, label, annotator) => {
+            const x0 = Number(sh.x0), y0 = Number(sh.y0), x1 = Number(sh.x1), y1 = Number(sh.y1);
+            const xc = (x0 + x1) / 2, yc = (y0 + y1) / 2;
+            const [lon0, lat0] = lonlat(x0, y0), [lon1, lat1] = lonlat(x1, y1), [lonc, latc] = lonlat(xc, yc);
+            return {
+                id: sh.name || new_id(), label: label, XREF: sh.xref, YREF: sh.yref,
+                X0: x0, Y0: y0, X1: x1, Y1: y1, Xcenter: xc, Ycenter: yc, annotator: annotator,
+                lon0: lon0, lat0: lat0, lon1: lon1, lat1: lat1, lon_center: lonc, lat_center: latc,
+            };
+        };
+
+        if (relayout.shapes) {
+            // all the shapes after one was drawn or erased
+            return relayout.shapes.map(sh => to_row(sh, config.labels[sh.line.color], annotator));
+        }
+        // corners of moved or resized shapes
+        const moved = {};
+        for (const key of Object.keys(relayout)) {
+            const match = key.match(/^shapes\\[([0-9]+)\\]\\.([xy][01])$/);
+            if (match && rows && rows[match[1]]) {
+                moved[match[1]] = Object.assign(moved[match[1]] || {}, {[match[2]]: relayout[key]});
+            }
+        }
+        if (Object.keys(moved).length === 0) {
+            return no_update;
+        }
+        const new_rows = rows.slice();
+        for (const [n, corners] of Object.entries(moved)) {
+            const row = rows[n];
+            const sh = Object.assign(
+                {x0: row.X0, y0: row.Y0, x1: row.X1, y1: row.Y1, xref: row.XREF, yref: row.YREF, name: row.id},
+                corners
+            );
+            new_rows[n] = to_row(sh, row.label, row.annotator);
+        }
+        return new_rows;
+    }
+    """,
+        Output("annotations-table", "data"),
+        [Input("frame-table", "data"), Input("graph", "relayoutData")],
+        [
+            State("annotations-table", "data"),
+            State("annotator-name-input", "value"),
+            State("annotations-table-config", "data"),
+        ],
+    )
 
 
-def annotations_table_shape_resize(annotations_table_data, fig_data, lon_interpolator, lat_interpolator):
+def requested_frame(image_dataloader, frame_request):
     """
-    Extract the shape that was resized (its index) and store the resized
-    coordinates.
+    Number of frame of frame request, None if there is no such frame
+
+    The request is either {"current": number} or {"jump": text} with datetime of the frame (the nearest one is
+    taken) or its number counted from 1.
     """
-    shapes = {}
-    for key in fig_data.keys():
-        shape_nb, coord = key.split(".")
-        # shape_nb is for example 'shapes[2].x0': this extracts the number
-        shape_nb = int(shape_nb.split(".")[0].split("[")[-1].split("]")[0])
-        # this should correspond to the same row in the data table
-        # we have to format the float here because this is exactly the entry in
-        # the table
-        # (no need to compute a time stamp, that is done for any change in the
-        # table values, so will be done later)
-        shapes.setdefault(shape_nb, {v: annotations_table_data[shape_nb][coord_to_tab_column(v)]
-                                     for v in ['x0', 'y0', 'x1', 'y1', 'xref', 'yref']})
-        shapes[shape_nb]['line'] = {'color': color_dict[annotations_table_data[shape_nb]['label']]}
-        shapes[shape_nb][coord] = fig_data[key]
-    for index, shape in shapes.items():
-        annotations_table_data[index] = shape_to_table_row(
-            shape,
-            annotator_name=shape.get('annotator', ''),
-            lon_interpolator=lon_interpolator,
-            lat_interpolator=lat_interpolator
-        )
-    return annotations_table_data
+    if not frame_request:
+        return None
+    if "jump" not in frame_request:
+        return frame_request["current"] % len(image_dataloader)
+    text = str(frame_request["jump"]).strip()
+    if text.isdigit():
+        return min(max(int(text), 1), len(image_dataloader)) - 1
+    try:
+        return image_dataloader.index.nearest(datetime.fromisoformat(text))
+    except (KeyError, ValueError):
+        return None
 
 
-def shape_to_table_row(sh, annotator_name, lon_interpolator, lat_interpolator):
-    x0, y0, x1, y1 = (float(sh[key]) for key in ['x0', 'y0', 'x1', 'y1'])
+def shapes_to_table_rows(shapes, annotator_name, georeferencer):
+    """Convert shapes to table rows, geographic coordinates of all the shapes are computed at once"""
+    if not shapes:
+        return []
+    corners = np.array([[float(sh[key]) for key in ['x0', 'y0', 'x1', 'y1']] for sh in shapes])
+    x0, y0, x1, y1 = corners.T
     xc = (x0 + x1)/2
     yc = (y0 + y1)/2
+    # columns: corner 0, corner 1, center
+    lon, lat = georeferencer.lonlat(np.stack([x0, x1, xc], axis=1), np.stack([y0, y1, yc], axis=1))
+    x0, y0, x1, y1, xc, yc = (a.tolist() for a in (x0, y0, x1, y1, xc, yc))
+    lon, lat = lon.tolist(), lat.tolist()
 
-    return {
-        "label": type_dict[sh["line"]["color"]],
-        "XREF": sh["xref"],
-        "YREF": sh["yref"],
-        "X0": x0,
-        "Y0": y0,
-        "X1": x1,
-        "Y1": y1,
-        "Xcenter": xc,
-        "Ycenter": yc,
-        "annotator": annotator_name,
-        "lon0": lon_interpolator(y0, x0)[0][0],
-        "lat0": lat_interpolator(y0, x0)[0][0],
-        "lon1": lon_interpolator(y1, x1)[0][0],
-        "lat1": lat_interpolator(y1, x1)[0][0],
-        "lon_center": lon_interpolator(yc, xc)[0][0],
-        "lat_center": lat_interpolator(yc, xc)[0][0]
-    }
+    return [
+        {
+            # DataTable uses the id as row id, it is the name of the shape in the figure
+            "id": sh.get("name") or uuid.uuid4().hex,
+            "label": type_dict[sh["line"]["color"]],
+            "XREF": sh["xref"],
+            "YREF": sh["yref"],
+            "X0": x0[n],
+            "Y0": y0[n],
+            "X1": x1[n],
+            "Y1": y1[n],
+            "Xcenter": xc[n],
+            "Ycenter": yc[n],
+            "annotator": annotator_name,
+            "lon0": lon[n][0],
+            "lat0": lat[n][0],
+            "lon1": lon[n][1],
+            "lat1": lat[n][1],
+            "lon_center": lon[n][2],
+            "lat_center": lat[n][2]
+        }
+        for n, sh in enumerate(shapes)
+    ]
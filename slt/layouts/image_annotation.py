@@ -1,20 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+import dash
 from dash import dcc
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
-import plotly.express as px
+import flask
+import hashlib
+import json
+import numpy as np
+import plotly.graph_objects as go
+from urllib.parse import quote
+import uuid
 
-from ..config import _projection
+from ..cache import FrameRenderCache
+from ..cache import KeyLocks
+from ..cache import LRUCache
+from ..images import encode_image
+from ..images import image_size
+from ..images import MIME_TYPES
+from ..images import passthrough_type
+from ..images import to_data_uri
+from ..metrics import metrics
+from ..navigation import LatestRequests
+from ..prefetch import FramePrefetcher
+from ..pyramid import downsample
+from ..pyramid import level_coords
+from ..pyramid import level_for_pixels
+from ..pyramid import tile_bounds
+from ..pyramid import TILE_SIZE
+from ..pyramid import visible_tiles
+from ..shared_cache import SharedFrameCache
+
+from ..config import _cache_path
+from ..config import _data_path
+from ..config import _shared_cache_path
+from ..config import ANIMATION_INTERVAL
+from ..config import ANIMATION_WINDOW
 from ..config import color_dict
+from ..config import DECODE_CACHE_BYTES
+from ..config import DECODE_CACHE_SIZE
+from ..config import DECODE_THREADS
 from ..config import DEFAULT_ATYPE
+from ..config import get_projection
+from ..config import IMAGE_FORMAT
+from ..config import IMAGE_MAX_AGE
+from ..config import IMAGE_QUALITY
+from ..config import NAVIGATION_DEBOUNCE
+from ..config import PANEL_COLUMNS
+from ..config import PREFETCH_WINDOW
+from ..config import PYRAMID_MAX_PIXELS
+from ..config import RENDER_CACHE_SIZE
 from ..config import SHAPE_PRECISION
+from ..config import SHARED_CACHE_BYTES
+from ..config import URL_PREFIX
 
 from ..utils import dl2np
-from ..utils import time_passed
+from ..utils import frame_key
 from ..utils import frame_timestamp
+from ..utils import select_products
+from ..utils import time_passed
+
+# tiles are always encoded into the figures, the original files cannot be cut into tiles
+TILE_FORMAT = 'jpeg' if IMAGE_FORMAT == 'passthrough' else IMAGE_FORMAT
+# the rendered frames and tiles depend on the image format, the URLs of the served images, the pyramid levels and
+# the panels in a row
+_render_namespace = f'{_data_path}:{IMAGE_FORMAT}:{IMAGE_QUALITY}:{URL_PREFIX}:{PYRAMID_MAX_PIXELS}:{PANEL_COLUMNS}'
+
+
+def fig_nbytes(fig):
+    """Approximate memory of a rendered figure dict, i.e. the length of its encoded images"""
+    items = fig.get('data', []) + fig.get('layout', {}).get('images', [])
+    return sum(len(item.get('source') or '') for item in items)
+
+
+# rendered frames shared by all callbacks, shape-only updates reuse the encoded images
+render_cache = FrameRenderCache(RENDER_CACHE_SIZE, cache_path=_cache_path, namespace=_render_namespace,
+                                max_bytes=DECODE_CACHE_BYTES // 4, sizeof=fig_nbytes)
+render_locks = KeyLocks()
+# decoded images of individual products of frames (see dl2np), optionally memory-mapped from the cache shared by
+# all workers, so that products are decoded only when displayed
+frame_cache = LRUCache(DECODE_CACHE_SIZE, max_bytes=DECODE_CACHE_BYTES, sizeof=lambda data: data.nbytes)
+frame_locks = KeyLocks()
+# products of a frame are decoded concurrently, decoding of JPEG images releases the GIL
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix='slt-decode')
+shared_frame_cache = None
+if _shared_cache_path is not None:
+    shared_frame_cache = SharedFrameCache(_shared_cache_path, namespace=str(_data_path), max_bytes=SHARED_CACHE_BYTES)
+# downsampled levels of decoded frames and encoded tiles of the levels, the tiles are kept on disk as the frames
+level_cache = LRUCache(DECODE_CACHE_SIZE, max_bytes=DECODE_CACHE_BYTES // 4, sizeof=lambda data: data.nbytes)
+level_locks = KeyLocks()
+tile_cache = FrameRenderCache(RENDER_CACHE_SIZE * 16, cache_path=_cache_path, namespace=f'{_render_namespace}:tiles',
+                              max_bytes=DECODE_CACHE_BYTES // 4, sizeof=lambda sources: sum(map(len, sources)))
+# images served at <prefix>images/ unless IMAGE_FORMAT is "png": (content, MIME type, ETag)
+image_cache = LRUCache(RENDER_CACHE_SIZE * 4, max_bytes=DECODE_CACHE_BYTES // 4, sizeof=lambda image: len(image[0]))
+# frames requested by the sessions, renders of the superseded frames are skipped
+latest_requests = LatestRequests()
+# (rows, columns) of image files by (name, modification time), see get_frame_shape
+size_cache = LRUCache(4096)
+
+
+def collect_cache_metrics(metrics):
+    caches = [('decoded', frame_cache), ('level', level_cache), ('image', image_cache),
+              ('render', render_cache.memory), ('tile', tile_cache.memory)]
+    for name, cache in caches:
+        metrics.set('slt_cache_evictions_total', cache.evictions, cache=name)
+        metrics.set('slt_cache_bytes', cache.nbytes, cache=name)
+        metrics.set('slt_cache_items', len(cache), cache=name)
+
+
+metrics.collect(collect_cache_metrics)
 
 
 # Cards
-def get_layout(image_dataloader, **kwargs):
+def get_layout(image_dataloader, initial_frame=True, **kwargs):
+    """Layout of the annotation area, the graph is empty without `initial_frame` (e.g. for validation)"""
+    if initial_frame:
+        figure = make_facet_fig(image_dataloader, 0, select_products(image_dataloader), annotation_type=DEFAULT_ATYPE)
+    else:
+        figure = go.Figure()
     return dbc.Card(
         id="imagebox",
         children=[
@@ -26,17 +128,51 @@ def get_layout(image_dataloader, **kwargs):
                         [
                             dbc.Button("Previous", id="previous", outline=True),
                             dbc.Button("Next", id="next", outline=True),
+                            dbc.Button("Propagate", id="propagate", outline=True),
+                            dbc.Button("Play", id="play", outline=True),
                         ],
                         size="sm",
                         # style={"width": "100%"},
                     ),
+                    dcc.Input(
+                        id="play-window", type="number", min=2, step=1, value=ANIMATION_WINDOW, debounce=True,
+                        style={"width": "4em", "margin-left": "0.5em"},
+                    ),
+                    dcc.Input(
+                        id="frame-jump", type="text", placeholder="Go to", debounce=True,
+                        style={"width": "11em", "margin-left": "0.5em"},
+                    ),
+                    dbc.Tooltip("Go to the next frame and propose the shapes of this frame moved with the clouds",
+                                target="propagate"),
+                    dbc.Tooltip("Number of frames played in a loop, the current frame is the last one",
+                                target="play-window"),
+                    dbc.Tooltip("Datetime (e.g. 2021-08-20 12:15) or number (from 1) of frame to go to, "
+                                "the nearest frame is shown",
+                                target="frame-jump"),
+                    # clicks on Previous/Next in a quick succession are sent as a single frame request
+                    dcc.Store(id="frame-request"),
+                    dcc.Store(id="frame-navigation", data={"debounce": NAVIGATION_DEBOUNCE}),
+                    dcc.Interval(id="navigation-interval", interval=max(NAVIGATION_DEBOUNCE // 3, 50),
+                                 disabled=True),
 
                     dcc.Graph(
                         id="graph",
-                        figure=make_facet_fig(image_dataloader, 0, annotation_type=DEFAULT_ATYPE),
+                        figure=figure,
                         config={"modeBarButtonsToAdd": ["drawrect", "eraseshape"]},
                         style={'width': '100%', 'height': '85vh'}
                     ),
+                    # the graph is assembled in the browser from the images of the current frame (sent only
+                    # when the frame changes) and from the shapes (sent on every change of annotations)
+                    dcc.Store(id="graph-frame"),
+                    dcc.Store(id="graph-shapes"),
+                    # frames larger than PYRAMID_MAX_PIXELS are sent downsampled, finer tiles of the zoomed
+                    # area are added as layout images
+                    dcc.Store(id="graph-viewport"),
+                    dcc.Store(id="graph-tiles"),
+                    # images of consecutive frames are sent once and played in the browser from a ring buffer
+                    dcc.Interval(id="play-interval", interval=ANIMATION_INTERVAL, disabled=True),
+                    dcc.Store(id="graph-animation"),
+                    dcc.Store(id="graph-animation-keys"),
 
                 ]
             ),
@@ -44,9 +180,112 @@ def get_layout(image_dataloader, **kwargs):
     )
 
 
-def activate_callbacks(app, image_dataloader):
+def activate_callbacks(app, image_dataloader, annotation_store):
+    # DECODE_CACHE_SIZE frames with all their products
+    frame_cache.maxsize = DECODE_CACHE_SIZE * len(image_dataloader.products)
+    level_cache.maxsize = frame_cache.maxsize
+    # keep the frames around the current one warm, the window must fit into the caches with the current frame
+    prefetcher = FramePrefetcher(
+        lambda i, products: get_frame_fig(image_dataloader, i, products),
+        len(image_dataloader),
+        window=min(PREFETCH_WINDOW, (min(RENDER_CACHE_SIZE, DECODE_CACHE_SIZE) - 1) // 2)
+    )
+
+    @app.server.route(app.config.routes_pathname_prefix + 'images/<fmt>/<int:level>/<version>/<path:name>')
+    def image_route(fmt, level, version, name):
+        info = image_dataloader.index.file(name)
+        if info is None or (fmt not in MIME_TYPES and fmt != 'original'):
+            flask.abort(404)
+        # revalidations are answered from the index without loading the image
+        etag = image_version(name, info[2], fmt, level)
+        if flask.request.if_none_match.contains(etag):
+            response = flask.Response(status=304)
+        else:
+            image = get_image(image_dataloader, fmt, level, name)
+            if image is None:
+                flask.abort(404)
+            content, mime_type, etag = image
+            response = flask.Response(content, mimetype=mime_type)
+        response.set_etag(etag)
+        if version == etag:
+            # the URL changes with the file, so browsers and proxies keep the image for good
+            response.cache_control.public = True
+            response.cache_control.max_age = IMAGE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            # URL of a modified file (e.g. in an old rendered frame), revalidated by the ETag
+            response.cache_control.no_cache = True
+        return response.make_conditional(flask.request)
+
+    # frame requests (see send_frame_table) are numbered, the first click on Previous/Next is sent at once,
+    # the following ones are collected until there is no click for NAVIGATION_DEBOUNCE milliseconds
+    app.clientside_callback(
+        """
+    function(previous, next, propagate, jump, n_intervals, image_files, navigation) {
+        const no_update = window.dash_clientside.no_update;
+        const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+        const now = Date.now();
+        const number = (navigation.number || 0) + 1;
+        if (triggered.includes("navigation-interval.n_intervals")) {
+            if (navigation.pending === undefined || now - navigation.clicked < navigation.debounce) {
+                return [no_update, no_update, navigation.pending === undefined];
+            }
+            const request = {current: navigation.pending, request: number};
+            return [request, {debounce: navigation.debounce, number: number, target: navigation.pending, sent: now},
+                    true];
+        }
+        if (triggered.includes("frame-jump.value")) {
+            if (!jump) {
+                return [no_update, no_update, no_update];
+            }
+            // the frame is looked up on the server, the next steps start from the frame it returns
+            return [{jump: jump, request: number}, {debounce: navigation.debounce, number: number, sent: now}, true];
+        }
+        const n_files = image_files.n_files;
+        // shapes are propagated from the last requested frame to the next one, the collected clicks are dropped
+        const propagating = triggered.includes("propagate.n_clicks");
+        const start = (navigation.pending !== undefined && !propagating) ? navigation.pending
+                      : (navigation.target !== undefined ? navigation.target : image_files.current);
+        const target = (start + (triggered.includes("previous.n_clicks") ? n_files - 1 : 1)) % n_files;
+        if (propagating || navigation.pending === undefined && !(now - navigation.sent < navigation.debounce)) {
+            const request = {current: target, request: number, propagate: propagating};
+            return [request, {debounce: navigation.debounce, number: number, target: target, sent: now}, true];
+        }
+        return [no_update, Object.assign({}, navigation, {pending: target, clicked: now}), false];
+    }
+    """,
+        [
+            Output("frame-request", "data"),
+            Output("frame-navigation", "data"),
+            Output("navigation-interval", "disabled"),
+        ],
+        [
+            Input("previous", "n_clicks"),
+            Input("next", "n_clicks"),
+            Input("propagate", "n_clicks"),
+            Input("frame-jump", "value"),
+            Input("navigation-interval", "n_intervals"),
+        ],
+        [State("image-files", "data"), State("frame-navigation", "data")],
+        prevent_initial_call=True,
+    )
+
+    @app.callback(
+        Output("graph-frame", "data"),
+        [Input("image-files", "data"), Input("product-selection", "value")],
+        [State("annotations-store", "data")],
+        prevent_initial_call=True,
+    )
+    def send_frame_to_graph(image_files_data, products, annotations_store):
+        if latest_requests.superseded(annotations_store["session"], image_files_data.get("request")):
+            return dash.no_update
+        products = select_products(image_dataloader, products)
+        fig = get_frame_fig(image_dataloader, image_files_data["current"], products)
+        prefetcher.schedule(image_files_data["current"], tuple(products))
+        return fig
+
     @app.callback(
-        [Output("graph", "figure"), Output("annotations-store", "data"), ],
+        Output("graph-shapes", "data"),
         [Input("annotations-table", "data"), Input("annotation-type-dropdown", "value")],
         [State("image-files", "data"), State("annotations-store", "data")],
     )
@@ -55,83 +294,503 @@ def activate_callbacks(app, image_dataloader):
     ):
         if annotations_table_data is None:
             # no labels -> just update the annotation type
-            fig = make_facet_fig(image_dataloader, image_files_data["current"], shapes=None,
-                                 annotation_type=annotation_type)
-            return (fig, annotations_store)
+            return make_fig_shapes(None, annotation_type)
 
         timestamp = frame_timestamp(image_dataloader, image_files_data["current"])
+        stored_shapes = annotation_store.get(annotations_store["session"], timestamp)
         # convert table rows to those understood by fig.update_layout
-        fig_shapes = [table_row_to_shape(sh) for sh in annotations_table_data]
-        # find the shapes that are new
-        new_shapes_i = []
-        old_shapes_i = []
-        for i, sh in enumerate(fig_shapes):
-            if not shape_in(annotations_store[timestamp]["shapes"])(sh):
-                new_shapes_i.append(i)
-            else:
-                old_shapes_i.append(i)
-        # add timestamps to the new shapes
-        for i in new_shapes_i:
-            fig_shapes[i]["timestamp"] = time_passed(annotations_store["starttime"])
-        # find the old shapes and look up their timestamps
-        for i in old_shapes_i:
-            old_shape_i = index_of_shape(
-                annotations_store[timestamp]["shapes"], fig_shapes[i]
-            )
-            fig_shapes[i]["timestamp"] = annotations_store[timestamp]["shapes"][
-                old_shape_i
-            ]["timestamp"]
-        shapes = fig_shapes
-
-        fig = make_facet_fig(image_dataloader, image_files_data["current"], shapes=shapes,
-                             annotation_type=annotation_type)
-
-        annotations_store[timestamp]["shapes"] = shapes
-
-        return (fig, annotations_store)
-
-
-def make_facet_fig(image_dataloader, i: int, annotation_type, shapes=None):
-    data, lat, lon = dl2np(image_dataloader[i])
-    fig = px.imshow(data, facet_col=0, binary_string=True,
-                    facet_col_wrap=2, facet_row_spacing=0.0001, facet_col_spacing=0.01,
-                    origin="lower", aspect='auto')
+        shapes = [table_row_to_shape(sh) for sh in annotations_table_data]
+        match_stored_shapes(shapes, stored_shapes, annotations_store["starttime"])
+
+        annotation_store.put(annotations_store["session"], timestamp, shapes)
+
+        return make_fig_shapes(shapes, annotation_type)
+
+    @app.callback(
+        Output("graph-tiles", "data"),
+        [Input("graph-viewport", "data"), Input("image-files", "data"), Input("product-selection", "value")],
+        [State("annotations-store", "data")],
+        prevent_initial_call=True,
+    )
+    def send_tiles_to_graph(viewport, image_files_data, products, annotations_store):
+        if latest_requests.superseded(annotations_store["session"], image_files_data.get("request")):
+            return dash.no_update
+        i = image_files_data["current"]
+        products = select_products(image_dataloader, products)
+        return {
+            "frame": frame_key(image_dataloader, i, products),
+            "images": make_tile_images(image_dataloader, i, products, viewport),
+        }
+
+    app.clientside_callback(
+        """
+    function(n_clicks, disabled) {
+        return [!disabled, disabled ? "Stop" : "Play"];
+    }
+    """,
+        [Output("play-interval", "disabled"), Output("play", "children")],
+        [Input("play", "n_clicks")],
+        [State("play-interval", "disabled")],
+        prevent_initial_call=True,
+    )
+
+    @app.callback(
+        Output("graph-animation", "data"),
+        [
+            Input("play-interval", "disabled"),
+            Input("image-files", "data"),
+            Input("product-selection", "value"),
+            Input("play-window", "value"),
+        ],
+        [State("graph-animation-keys", "data")],
+        prevent_initial_call=True,
+    )
+    def send_animation_to_graph(disabled, image_files_data, products, window, buffered_keys):
+        if disabled:
+            return dash.no_update
+        products = select_products(image_dataloader, products)
+        return make_animation(image_dataloader, image_files_data["current"], products, window or ANIMATION_WINDOW,
+                              buffered_keys or [])
+
+    # ring buffer of images of the played frames, the server sends just the frames which are not in the buffer
+    app.clientside_callback(
+        """
+    function(animation) {
+        const ring = window.slt_animation_ring = window.slt_animation_ring || new Map();
+        if (!animation) {
+            return window.dash_clientside.no_update;
+        }
+        for (const frame of animation.frames) {
+            if (frame.sources) {
+                ring.delete(frame.key);
+                ring.set(frame.key, frame.sources);
+            }
+        }
+        // the map keeps the insertion order, the oldest frames out of the window are dropped first
+        const window_keys = new Set(animation.frames.map(frame => frame.key));
+        for (const key of Array.from(ring.keys())) {
+            if (ring.size <= 2 * window_keys.size) {
+                break;
+            }
+            if (!window_keys.has(key)) {
+                ring.delete(key);
+            }
+        }
+        return Array.from(ring.keys());
+    }
+    """,
+        Output("graph-animation-keys", "data"),
+        [Input("graph-animation", "data")],
+    )
+
+    # keep the visible area of the graph, relayout events of shapes are ignored
+    app.clientside_callback(
+        """
+    function(relayout, viewport) {
+        if (!relayout) {
+            return window.dash_clientside.no_update;
+        }
+        const keys = Object.keys(relayout);
+        if (keys.some(k => /^[xy]axis[0-9]*\\.autorange$/.test(k))) {
+            return null;
+        }
+        let new_viewport = Object.assign({x: null, y: null}, viewport);
+        let changed = false;
+        const patterns = {x: /^xaxis[0-9]*\\.range(\\[0\\])?$/, y: /^yaxis[0-9]*\\.range(\\[0\\])?$/};
+        for (const axis of ["x", "y"]) {
+            const key = keys.find(k => patterns[axis].test(k));
+            if (key) {
+                new_viewport[axis] = key.endsWith("[0]")
+                    ? [relayout[key], relayout[key.replace("[0]", "[1]")]] : relayout[key];
+                changed = true;
+            }
+        }
+        return changed ? new_viewport : window.dash_clientside.no_update;
+    }
+    """,
+        Output("graph-viewport", "data"),
+        [Input("graph", "relayoutData")],
+        [State("graph-viewport", "data")],
+    )
+
+    # put together the frame images, the tiles and the shapes, the images already present in the graph
+    # are reused when only the shapes or the tiles change, the images of the played frames are taken
+    # from the ring buffer
+    app.clientside_callback(
+        """
+    function(frame_fig, fig_shapes, tiles, n_intervals, paused, animation, fig) {
+        const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+        let new_fig = fig;
+        if (frame_fig && triggered.includes("graph-frame.data")) {
+            new_fig = frame_fig;
+        }
+        let layout = Object.assign({}, new_fig.layout);
+        // served images of the frame are layout images (see render_frame_fig), the tiles are put over them
+        let frame_images = (layout.meta && layout.meta.images) || [];
+        if (new_fig === fig && layout.images && layout.images.length >= frame_images.length) {
+            // keep the shown images, e.g. of a played frame
+            frame_images = layout.images.slice(0, frame_images.length);
+        }
+        const ring = window.slt_animation_ring;
+        if (animation && ring && (triggered.includes("play-interval.n_intervals")
+                                  || triggered.includes("play-interval.disabled"))) {
+            // the last frame of the window is the current one, it is shown when the animation stops
+            const frames = animation.frames;
+            const frame = paused ? frames[frames.length - 1] : frames[(n_intervals || 0) % frames.length];
+            const sources = ring.get(frame.key);
+            if (sources && sources.length === new_fig.data.length) {
+                if (frame_images.length) {
+                    frame_images = frame_images.map((image, k) => Object.assign({}, image, {source: sources[k]}));
+                } else {
+                    new_fig = {data: new_fig.data.map((trace, k) => Object.assign({}, trace, {source: sources[k]}))};
+                }
+                layout.title = paused ? {} : {text: frame.label, x: 0.5, y: 0.99};
+            }
+        }
+        if (fig_shapes) {
+            // shapes of panels which are not displayed are moved to the first panel
+            const has_axes = sh => layout[sh.xref.replace("x", "xaxis")] && layout[sh.yref.replace("y", "yaxis")];
+            layout.shapes = fig_shapes.shapes.map(
+                sh => has_axes(sh) ? sh : Object.assign({}, sh, {xref: "x", yref: "y"})
+            );
+            layout.newshape = Object.assign({}, layout.newshape, {line: {color: fig_shapes.newshape_line_color}});
+        }
+        const frame = layout.meta ? layout.meta.frame : null;
+        const tile_images = (paused !== false && tiles && tiles.frame === frame) ? tiles.images : [];
+        layout.images = frame_images.concat(tile_images);
+        return {data: new_fig.data, layout: layout};
+    }
+    """,
+        Output("graph", "figure"),
+        [
+            Input("graph-frame", "data"),
+            Input("graph-shapes", "data"),
+            Input("graph-tiles", "data"),
+            Input("play-interval", "n_intervals"),
+            Input("play-interval", "disabled"),
+        ],
+        [State("graph-animation", "data"), State("graph", "figure")],
+        prevent_initial_call=True,
+    )
+
+
+def make_facet_fig(image_dataloader, i: int, products, annotation_type, shapes=None):
+    fig = go.Figure(get_frame_fig(image_dataloader, i, products))
+    fig_shapes = make_fig_shapes(shapes, annotation_type)
+    fig.update_layout(
+        shapes=fig_shapes["shapes"],
+        newshape_line_color=fig_shapes["newshape_line_color"]
+    )
+
+    return fig
+
+
+def make_fig_shapes(shapes, annotation_type):
+    """Shape related part of figure layout, this is all that changes while annotating a frame"""
+    return {
+        "shapes": [shape_data_remove_not_shape_parameters(sh) for sh in shapes or []],
+        "newshape_line_color": color_dict[annotation_type],
+    }
+
+
+def get_frame_fig(image_dataloader, i: int, products):
+    """Get figure of i-th frame with the given products without shapes from the render cache, render it if missing"""
+    key = frame_key(image_dataloader, i, products)
+    fig = render_cache.get(key)
+    if fig is None:
+        with render_locks(key):
+            fig = render_cache.get(key)
+            if fig is None:
+                metrics.inc('slt_cache_requests_total', cache='render', result='miss')
+                fig_json = render_frame_fig(image_dataloader, i, products).to_json()
+                fig = json.loads(fig_json)
+                render_cache.put(key, fig, fig_json)
+    else:
+        metrics.inc('slt_cache_requests_total', cache='render', result='hit')
+    return fig
+
+
+def prerender_frame(image_dataloader, i: int, products):
+    """Render i-th frame and the tiles of all its finer pyramid levels into the caches"""
+    shape = get_frame_shape(image_dataloader, i, products)
+    rows, cols = shape[1:3]
+    for level in range(get_overview_level(shape)):
+        for ty, tx in visible_tiles((rows, cols), level, [-0.5, cols - 0.5], [-0.5, rows - 0.5]):
+            get_tile(image_dataloader, i, products, level, ty, tx)
+    # the frame figure comes last, its presence marks a completely rendered frame
+    get_frame_fig(image_dataloader, i, products)
+
+
+def make_animation(image_dataloader, i: int, products, window: int, buffered_keys):
+    """
+    Images of `window` consecutive frames ending with i-th frame
+
+    Frames are identified by their keys, images (sources of the frame figures, see frame_sources) are omitted
+    for the frames already in the ring buffer of the browser (`buffered_keys`).
+    """
+    # all the frames must fit into the render cache
+    window = max(2, min(window, len(image_dataloader), RENDER_CACHE_SIZE))
+    frames = []
+    for j in range(i - window + 1, i + 1):
+        j %= len(image_dataloader)
+        key = frame_key(image_dataloader, j, products)
+        sources = None
+        if key not in buffered_keys:
+            sources = frame_sources(get_frame_fig(image_dataloader, j, products))
+        frames.append({"key": key, "label": frame_timestamp(image_dataloader, j), "sources": sources})
+    return {"frames": frames}
+
+
+def frame_sources(fig):
+    """Encoded images or URLs of the images of frame figure ordered as its traces"""
+    images = fig["layout"].get("meta", {}).get("images")
+    if images:
+        return [image["source"] for image in images]
+    return [trace["source"] for trace in fig["data"]]
+
+
+def get_product_data(image_dataloader, i: int, product):
+    """Get decoded image of a product of i-th frame (see dl2np) from the frame caches, decode it if missing"""
+    key = f'{frame_timestamp(image_dataloader, i)}/{product}'
+    data = frame_cache.get(key)
+    if data is None:
+        with frame_locks(key):
+            data = frame_cache.get(key)
+            if data is None:
+                metrics.inc('slt_cache_requests_total', cache='decoded', result='miss')
+                if shared_frame_cache is not None:
+                    # the cache outlives the processes, so a replaced image file must not hit its old frame
+                    index = image_dataloader.index
+                    shared_key = f'{key}/{index.file(index.files(i, [product])[0][0])[2]}'
+                    data = shared_frame_cache.get(shared_key)
+                    metrics.inc('slt_cache_requests_total', cache='shared', result='miss' if data is None else 'hit')
+                if data is None:
+                    data = dl2np(image_dataloader.load(i, [product]))[0]
+                    if shared_frame_cache is not None:
+                        data = shared_frame_cache.put(shared_key, data)
+                frame_cache.put(key, data)
+    else:
+        metrics.inc('slt_cache_requests_total', cache='decoded', result='hit')
+    return data
+
+
+def get_frame_data(image_dataloader, i: int, products):
+    """
+    Decoded images (n_products, rows, columns, channels) of the given products of i-th frame
+
+    All the products are decoded concurrently, the frame is allocated when the first one is decoded and every
+    product is copied into its slice as soon as it is ready.
+    """
+    if len(products) == 1:
+        return get_product_data(image_dataloader, i, products[0])[None]
+    futures = [decode_pool.submit(get_product_data, image_dataloader, i, product) for product in products]
+    first = futures[0].result()
+    data = np.empty((len(products),) + first.shape, dtype=first.dtype)
+    for k, future in enumerate(futures):
+        data[k] = future.result()
+    return data
+
+
+def get_frame_shape(image_dataloader, i: int, products):
+    """
+    Shape (n_products, rows, columns) of i-th frame
+
+    The size is read from the header of the image file of the first product, the image is decoded only if
+    the header cannot be read.
+    """
+    index = image_dataloader.index
+    name = index.files(i, products[:1])[0][0]
+    key = (name, index.file(name)[2])
+    size = size_cache.get(key)
+    if size is None:
+        try:
+            size = image_size(index.data_path / name)
+        except OSError:  # e.g. format unknown to PIL
+            size = get_product_data(image_dataloader, i, products[0]).shape[:2]
+        size_cache.put(key, size)
+    return (len(products),) + tuple(size)
+
+
+def get_frame_level(image_dataloader, i: int, products, level: int):
+    """Get decoded images of i-th frame downsampled 2**level times"""
+    if level == 0:
+        return get_frame_data(image_dataloader, i, products)
+    return np.stack([get_product_level(image_dataloader, i, product, level) for product in products])
+
+
+def get_product_level(image_dataloader, i: int, product, level: int):
+    """Get decoded image of a product of i-th frame downsampled 2**level times"""
+    if level == 0:
+        return get_product_data(image_dataloader, i, product)
+    key = (f'{frame_timestamp(image_dataloader, i)}/{product}', level)
+    data = level_cache.get(key)
+    if data is None:
+        with level_locks(key):
+            data = level_cache.get(key)
+            if data is None:
+                data = downsample(get_product_level(image_dataloader, i, product, level - 1))
+                level_cache.put(key, data)
+    return data
+
+
+def get_overview_level(data_shape):
+    """Pyramid level of frame with (n_images, rows, columns, ...) decoded data shape sent as the frame figure"""
+    return level_for_pixels(data_shape[2], data_shape[1], PYRAMID_MAX_PIXELS)
+
+
+def make_tile_images(image_dataloader, i: int, products, viewport):
+    """
+    Layout images of tiles of i-th frame covering the viewport
+
+    Tiles are used only when the viewport ({"x": [x0, x1], "y": [y0, y1]} in full resolution pixels, missing
+    or None for the whole image) needs finer pyramid level than the one in the frame figure.
+    """
+    shape = get_frame_shape(image_dataloader, i, products)
+    rows, cols = shape[1:3]
+    viewport = viewport or {}
+    x_range = viewport.get("x") or [-0.5, cols - 0.5]
+    y_range = viewport.get("y") or [-0.5, rows - 0.5]
+    level = level_for_pixels(abs(x_range[1] - x_range[0]), abs(y_range[1] - y_range[0]), PYRAMID_MAX_PIXELS)
+    if level >= get_overview_level(shape):
+        return []
+
+    axes = [(trace["xaxis"], trace["yaxis"]) for trace in get_frame_fig(image_dataloader, i, products)["data"]]
+    images = []
+    for ty, tx in visible_tiles((rows, cols), level, x_range, y_range):
+        row0, row1, col0, col1 = tile_bounds((rows, cols), level, ty, tx)
+        for (xref, yref), source in zip(axes, get_tile(image_dataloader, i, products, level, ty, tx)):
+            # the decoded images are flipped upside down, the tiles are placed by their upper left corners
+            images.append(dict(
+                source=source, xref=xref, yref=yref, x=col0 - 0.5, y=row1 - 0.5,
+                sizex=col1 - col0, sizey=row1 - row0, xanchor="left", yanchor="top",
+                sizing="stretch", layer="above",
+            ))
+    return images
+
+
+def get_tile(image_dataloader, i: int, products, level: int, ty: int, tx: int):
+    """Encoded tile of every image of i-th frame"""
+    key = (frame_key(image_dataloader, i, products), level, ty, tx)
+    sources = tile_cache.get(key)
+    metrics.inc('slt_cache_requests_total', cache='tile', result='miss' if sources is None else 'hit')
+    if sources is None:
+        data = get_frame_level(image_dataloader, i, products, level)
+        tiles = data[:, ty * TILE_SIZE:(ty + 1) * TILE_SIZE, tx * TILE_SIZE:(tx + 1) * TILE_SIZE][:, ::-1]
+        sources = [to_data_uri(encode_image(tile, TILE_FORMAT, IMAGE_QUALITY), MIME_TYPES[TILE_FORMAT])
+                   for tile in tiles]
+        tile_cache.put(key, sources)
+    return sources
+
+
+def render_frame_fig(image_dataloader, i: int, products):
+    """
+    Encode decoded images of i-th frame into a facet figure, large images are downsampled
+
+    Unless IMAGE_FORMAT is "png", the images are not encoded here, the figure refers to the images served
+    at <prefix>images/ by layout images kept also in `layout.meta.images`.
+    """
+    # plotly.express imports pandas, it is imported with the first rendered frame instead of the application
+    import plotly.express as px
+
+    shape = get_frame_shape(image_dataloader, i, products)
+    level = get_overview_level(shape)
+    imshow_kwargs = dict()
+    if IMAGE_FORMAT == 'png':
+        data = get_frame_level(image_dataloader, i, products, level)
+        if level > 0:
+            # keep the full resolution pixel coordinates
+            imshow_kwargs = dict(x=level_coords(shape[2], level), y=level_coords(shape[1], level))
+    else:
+        # just the panels, the images are set below
+        data = np.zeros((len(products), 1, 1, 4), dtype=np.uint8)
+    fig = px.imshow(data, facet_col=0, binary_string=IMAGE_FORMAT == 'png',
+                    facet_col_wrap=min(len(products), PANEL_COLUMNS), facet_row_spacing=0.0001,
+                    facet_col_spacing=0.01, origin="lower", aspect='auto', **imshow_kwargs)
     for anno in fig['layout']['annotations']:
         anno['text'] = ''
         anno['height'] = 1.01
 
     fig['layout'].update(margin=dict(l=0, r=0, b=0, t=30))
 
-    if shapes is not None:
-        fig.update_layout(
-            shapes=[shape_data_remove_not_shape_parameters(sh) for sh in shapes]
-        )
-    fig.update_layout(
-        # reduce space between image and graph edges
-        newshape_line_color=color_dict[annotation_type],
-        yaxis=dict(
-            title_text="",
-            titlefont=dict(size=1),
-        ),
-        xaxis=dict(
-            title_text="",
-            titlefont=dict(size=1),
-        ),
-        xaxis2=dict(
-            title_text="",
-            titlefont=dict(size=1),
-        ),
-        yaxis3=dict(
-            title_text="",
-            titlefont=dict(size=1),
-        )
-        # dragmode="drawrect",
-    )
+    # reduce space between image and graph edges
+    fig.update_xaxes(title_text="", title_font=dict(size=1))
+    fig.update_yaxes(title_text="", title_font=dict(size=1))
     fig['layout']['uirevision'] = 'some-constant'
+    fig['layout']['meta'] = {'frame': frame_key(image_dataloader, i, products)}
+    if IMAGE_FORMAT != 'png':
+        rows, cols = shape[1:3]
+        index = image_dataloader.index
+        names = {product: name for name, product in index.files(i, products)}
+        images = []
+        for trace, product in zip(fig.data, products):
+            # transparent pixel covering the image spans the axes
+            trace.update(z=[[[0, 0, 0, 0]]], colormodel='rgba', x0=(cols - 1) / 2, dx=cols, y0=(rows - 1) / 2,
+                         dy=rows, hoverinfo='skip', hovertemplate=None)
+            name = names[product]
+            # the served images are not flipped (see dl2np), they are placed by their upper left corners
+            images.append(dict(
+                source=image_url(name, index.file(name)[2], level), xref=trace.xaxis, yref=trace.yaxis,
+                x=-0.5, y=rows - 0.5, sizex=cols, sizey=rows, xanchor="left", yanchor="top", sizing="stretch",
+                layer="above",
+            ))
+        fig['layout']['images'] = images
+        fig['layout']['meta']['images'] = images
 
     return fig
 
 
+def served_format(name, level: int):
+    """Format of served image file at pyramid level, "original" for the file as it is"""
+    if IMAGE_FORMAT != 'passthrough':
+        return IMAGE_FORMAT
+    return 'original' if level == 0 and passthrough_type(name) else 'jpeg'
+
+
+def image_version(name, mtime, fmt, level: int):
+    """Hash of served image file identifying its content, used as the ETag and in the URL"""
+    return hashlib.sha1(f'{name}:{mtime}:{fmt}:{level}:{IMAGE_QUALITY}'.encode()).hexdigest()[:20]
+
+
+def image_url(name, mtime, level: int):
+    """Content-hashed URL of served image file with the given modification time at pyramid level"""
+    fmt = served_format(name, level)
+    return f'{URL_PREFIX}images/{fmt}/{level}/{image_version(name, mtime, fmt, level)}/{quote(name)}'
+
+
+def get_image(image_dataloader, fmt, level: int, name):
+    """
+    Served image file at pyramid level as (content, MIME type, ETag) from the image cache, None if not found
+
+    The "original" format is the file itself, the other ones are the decoded image re-encoded with IMAGE_QUALITY.
+    """
+    info = image_dataloader.index.file(name)
+    if info is None or (fmt not in MIME_TYPES and fmt != 'original'):
+        return None
+    timestamp, product, mtime = info
+    etag = image_version(name, mtime, fmt, level)
+    key = (fmt, level, name)
+    image = image_cache.get(key)
+    metrics.inc('slt_cache_requests_total', cache='image', result='miss' if image is None else 'hit')
+    if image is not None and image[2] == etag:
+        return image
+
+    i = image_dataloader.index.index(timestamp)
+    if fmt == 'original':
+        mime_type = passthrough_type(name)
+        if mime_type is None or level != 0:
+            return None
+        content = (image_dataloader.index.data_path / name).read_bytes()
+    else:
+        if level > get_overview_level(get_frame_shape(image_dataloader, i, [product])):
+            return None
+        # undo the flip of the decoded images
+        data = get_product_level(image_dataloader, i, product, level)[::-1]
+        content, mime_type = encode_image(data, fmt, IMAGE_QUALITY), MIME_TYPES[fmt]
+    image = (content, mime_type, etag)
+    image_cache.put(key, image)
+    return image
+
+
 def shape_data_remove_not_shape_parameters(shape):
     """
     go.Figure complains if we include the 'timestamp' key when updating the
@@ -169,28 +828,39 @@ def table_row_to_shape(tr):
         "lon_center": tr["lon_center"],
         "lat_center": tr["lat_center"],
         "label": tr["label"],
-        "projection": _projection
+        "projection": get_projection(),
+        # id of the shape, plotly keeps the name when the shape is edited
+        "name": tr.get("id")
     }
 
 
-def shape_cmp(s0, s1):
-    """ Compare two shapes """
+def shape_key(shape):
+    """ Corners of shape rounded to SHAPE_PRECISION and its color, shapes with equal keys are considered the same """
     return (
-            (round(s0["x0"], SHAPE_PRECISION) == round(s1["x0"], SHAPE_PRECISION))
-            and (round(s0["x1"], SHAPE_PRECISION) == round(s1["x1"], SHAPE_PRECISION))
-            and (round(s0["y0"], SHAPE_PRECISION) == round(s1["y0"], SHAPE_PRECISION))
-            and (round(s0["y1"], SHAPE_PRECISION) == round(s1["y1"], SHAPE_PRECISION))
-            and (s0["line"]["color"] == s1["line"]["color"])
+        round(shape["x0"], SHAPE_PRECISION),
+        round(shape["x1"], SHAPE_PRECISION),
+        round(shape["y0"], SHAPE_PRECISION),
+        round(shape["y1"], SHAPE_PRECISION),
+        shape["line"]["color"],
     )
 
 
-def shape_in(se):
-    """ check if a shape is in list (done this way to use custom compare) """
-    return lambda s: any(shape_cmp(s, s_) for s_ in se)
-
+def match_stored_shapes(shapes, stored_shapes, starttime):
+    """
+    Give shapes the names and the timestamps of the stored ones, new shapes get a new name and the current time
 
-def index_of_shape(shapes, shape):
-    for i, shapes_item in enumerate(shapes):
-        if shape_cmp(shapes_item, shape):
-            return i
-    raise ValueError  # not found
+    Shapes are matched to the stored ones by their names (ids), stored shapes without names by their corners and
+    color (see shape_key). The shapes are updated in place and returned.
+    """
+    stored_by_id = {sh["name"]: sh for sh in stored_shapes if sh.get("name")}
+    stored_by_key = {shape_key(sh): sh for sh in stored_shapes}
+    for sh in shapes:
+        old_shape = stored_by_id.get(sh.get("name")) or stored_by_key.get(shape_key(sh))
+        if old_shape is None:
+            # add timestamps to the new shapes
+            sh["timestamp"] = time_passed(starttime)
+        else:
+            # look up timestamps of the old shapes
+            sh["timestamp"] = old_shape["timestamp"]
+        sh["name"] = sh.get("name") or (old_shape or {}).get("name") or uuid.uuid4().hex
+    return shapes
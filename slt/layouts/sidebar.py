@@ -1,10 +1,12 @@
-from dash import dash_table
 from dash import dcc
 from dash import html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 
+from ..export import export_formats
+
 from ..utils import frame_timestamp
+from ..utils import select_products
 
 from ..config import DEFAULT_ATYPE
 from ..config import annotation_types
@@ -68,22 +70,15 @@ def get_layout(image_dataloader, **kwargs):
                         dbc.Col(
                             [
                                 html.H6("Composites"),
-                                html.Div(
-                                    dash_table.DataTable(
-                                        id="frame-description-composites",
-                                        columns=[{'name': 'col0', 'id': 'col0'},
-                                                 {'name': 'col1', 'id': 'col1'}],
-                                        data=get_image_composites(image_dataloader, 0),
-                                        css=[
-                                            {
-                                                'selector': 'tr:first-child',
-                                                'rule': 'display: none',
-                                            },
-                                        ],
-                                        style_cell={'textAlign': 'center'},
-                                    ),
-                                    style={'margin-top': '0.5em'}
-                                )
+                                # only the selected products are loaded and displayed
+                                dcc.Checklist(
+                                    id="product-selection",
+                                    options=[{"label": p, "value": p} for p in image_dataloader.products],
+                                    value=select_products(image_dataloader),
+                                    labelStyle={"display": "block"},
+                                    inputStyle={"margin-right": "0.5em"},
+                                    style={'margin-top': '0.5em'},
+                                ),
                             ],
                             align='center'
                         )
@@ -94,20 +89,20 @@ def get_layout(image_dataloader, **kwargs):
                 [
                     html.Div(
                         [
-                            # We use this pattern because we want to be able to download the
-                            # annotations by clicking on a button
-                            html.A(
-                                id="download",
-                                download="annotations.json",
-                                # make invisble, we just want it to click on it
-                                style={"display": "none"},
+                            dcc.Dropdown(
+                                id="download-format",
+                                options=[{"label": fmt, "value": fmt} for fmt in export_formats()],
+                                value="jsonl",
+                                clearable=False,
+                                style={"margin-bottom": "0.5em"},
                             ),
+                            # the link to the export route is set by a callback (see annotation_table)
                             dbc.Button(
-                                "Download annotations", id="download-button", outline=True,
+                                "Download annotations", id="download-button", outline=True, external_link=True,
                             ),
-                            html.Div(id="dummy", style={"display": "none"}),
                             dbc.Tooltip(
-                                "You can download the annotated data in a .json format by clicking this button",
+                                "You can download the annotated data in JSON Lines, CSV or Parquet format by "
+                                "clicking this button",
                                 target="download-button",
                             ),
                         ],
@@ -119,17 +114,10 @@ def get_layout(image_dataloader, **kwargs):
     )
 
 
-def get_image_composites(image_dataloader, i):
-    composites = [im.attrs.get('product', '??') for im in image_dataloader[i]]
-    return [{'col0': composites[0], 'col1': composites[1]},
-            {'col0': composites[2], 'col1': composites[3]}]
-
-
 def activate_callbacks(app, image_dataloader):
     @app.callback(
         Output("frame-description-datetime", "children"),
-        Input("graph", "figure"),
-        State("image-files", "data")
+        Input("image-files", "data")
     )
-    def update_datetime_label(fig, image_files_data):
+    def update_datetime_label(image_files_data):
         return frame_timestamp(image_dataloader, image_files_data["current"])
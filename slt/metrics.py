@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import time
+
+import flask
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    Counters and histograms of the process in Prometheus text format
+
+    Metrics are kept per process, i.e. every worker of the production server reports its own. Values of gauges
+    (or counters kept elsewhere) are set by the collector functions called before rendering.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._values = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts, total = self._histograms.get(key, ([0] * (len(self.buckets) + 1), 0.))
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[n] += 1
+            counts[-1] += 1
+            self._histograms[key] = (counts, total + value)
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def collect(self, collector):
+        """Register function setting values of metrics, called before rendering"""
+        self._collectors.append(collector)
+
+    def get(self, name, **labels):
+        """Value of a counter or of a set metric"""
+        key = (name, tuple(sorted(labels.items())))
+        return self._counters.get(key, self._values.get(key, 0))
+
+    def render(self):
+        for collector in self._collectors:
+            collector(self)
+        lines = []
+        with self._lock:
+            keys = list(self._counters) + list(self._histograms) + list(self._values)
+            names = sorted({name for name, labels in keys})
+            for name in names:
+                if name in self._help:
+                    kind, help_text = self._help[name]
+                    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for (counter, labels), value in sorted(list(self._counters.items()) + list(self._values.items())):
+                    if counter == name:
+                        lines.append(f'{name}{_labels(labels)} {value}')
+                for (histogram, labels), (counts, total) in sorted(self._histograms.items()):
+                    if histogram == name:
+                        for bound, count in zip(self.buckets + ('+Inf',), counts):
+                            lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {count}')
+                        lines.append(f'{name}_sum{_labels(labels)} {total}')
+                        lines.append(f'{name}_count{_labels(labels)} {counts[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+metrics.describe('slt_callback_duration_seconds', 'histogram', 'Time of Dash callback requests')
+metrics.describe('slt_callback_request_bytes_total', 'counter', 'Size of Dash callback requests')
+metrics.describe('slt_callback_response_bytes_total', 'counter', 'Size of Dash callback responses')
+metrics.describe('slt_callback_errors_total', 'counter', 'Dash callback requests which failed')
+metrics.describe('slt_cache_requests_total', 'counter', 'Look-ups of frame caches by cache and result')
+metrics.describe('slt_cache_evictions_total', 'counter', 'Items evicted from in-memory caches by cache')
+metrics.describe('slt_cache_bytes', 'gauge', 'Size of items in in-memory caches by cache')
+metrics.describe('slt_cache_items', 'gauge', 'Number of items in in-memory caches by cache')
+
+
+def register_metrics(app, log=False):
+    """
+    Measure all server callbacks and add route with the metrics
+
+    Callbacks are measured around the Dash update requests, GET <prefix>metrics returns the metrics in
+    Prometheus text format. With `log` every callback request is also logged as a JSON line.
+    """
+    server = app.server
+    if log and not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+    update_path = app.config.routes_pathname_prefix + '_dash-update-component'
+
+    @server.before_request
+    def start_timer():
+        if flask.request.path == update_path:
+            flask.g.slt_start = time.perf_counter()
+
+    @server.after_request
+    def record_callback(response):
+        start = flask.g.pop('slt_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        body = flask.request.get_json(silent=True) or {}
+        callback = body.get('output', '')
+        request_bytes = flask.request.content_length or 0
+        response_bytes = response.calculate_content_length() or 0
+        metrics.observe('slt_callback_duration_seconds', duration, callback=callback)
+        metrics.inc('slt_callback_request_bytes_total', request_bytes, callback=callback)
+        metrics.inc('slt_callback_response_bytes_total', response_bytes, callback=callback)
+        if response.status_code >= 500:
+            metrics.inc('slt_callback_errors_total', callback=callback)
+        if log:
+            logger.info(json.dumps({
+                'callback': callback,
+                'trigger': body.get('changedPropIds'),
+                'status': response.status_code,
+                'duration': round(duration, 6),
+                'request_bytes': request_bytes,
+                'response_bytes': response_bytes,
+            }))
+        return response
+
+    @server.route(app.config.routes_pathname_prefix + 'metrics')
+    def metrics_route():
+        return flask.Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics_route
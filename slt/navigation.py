@@ -0,0 +1,25 @@
+import threading
+
+from .cache import LRUCache
+
+
+class LatestRequests:
+    """
+    Numbers of the latest frame requests of the sessions, callbacks of superseded frames are dropped
+
+    The browser numbers the frame requests of a session (see the navigation callback), a frame requested with
+    a lower number than the latest one is not going to be shown. Every process knows only the requests it has
+    handled, which is enough to skip most of the renders when skimming through the frames.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._latest = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def put(self, session, number):
+        with self._lock:
+            if number > self._latest.get(session, -1):
+                self._latest.put(session, number)
+
+    def superseded(self, session, number):
+        return number is not None and number < self._latest.get(session, -1)
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from .utils import debug_print
+
+
+class FramePrefetcher:
+    """
+    Warm caches of the frames around the current one in background threads
+
+    After frame `i` is served, frames i±1..i±window are passed to `warm` (with any further arguments
+    of `schedule`) so that stepping to the previous or the next frame hits warm caches. Scheduling
+    a new frame cancels the pending warm-ups which are out of the new window.
+    """
+
+    def __init__(self, warm, n_frames, window=2, max_workers=2):
+        self.warm = warm
+        self.n_frames = n_frames
+        self.window = window
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='slt-prefetch')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def neighbours(self, i: int):
+        """Indices of frames to prefetch, the nearest ones first, the next frames before the previous ones"""
+        indices = []
+        for offset in range(1, self.window + 1):
+            for j in ((i + offset) % self.n_frames, (i - offset) % self.n_frames):
+                if j != i and j not in indices:
+                    indices.append(j)
+        return indices
+
+    def schedule(self, i: int, *args):
+        if self.window <= 0:
+            return
+        keys = [(j,) + args for j in self.neighbours(i)]
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                if key not in keys and future.cancel():
+                    del self._pending[key]
+            for key in keys:
+                if key not in self._pending:
+                    future = self._executor.submit(self._warm, key)
+                    self._pending[key] = future
+
+    def _warm(self, key):
+        try:
+            self.warm(*key)
+        except Exception as e:  # prefetching is optional, the frame is loaded again on request
+            debug_print(f'prefetching of frame {key[0]} failed: {e!r}')
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import sys
+import time
+
+from .datasets import IndexedImageDataset
+from .utils import frame_key
+from .utils import select_products
+
+from .config import _cache_path
+from .config import _data_path
+from .config import _image_file_mask
+from .config import _index_path
+
+_image_dataloader = None
+
+
+def get_image_dataloader():
+    return IndexedImageDataset(_data_path, file_mask=_image_file_mask, index_path=_index_path)
+
+
+def _init_worker():
+    global _image_dataloader
+    _image_dataloader = get_image_dataloader()
+
+
+def _prerender(i: int):
+    from .layouts.image_annotation import prerender_frame
+
+    try:
+        prerender_frame(_image_dataloader, i, select_products(_image_dataloader))
+    except Exception as e:
+        return i, repr(e)
+    return i, None
+
+
+def prerender(jobs=None, force=False, out=sys.stderr):
+    """
+    Render all frames of the image directory into the on-disk cache in parallel processes
+
+    Frames are rendered with the default products (SLT_PRODUCTS). Rendering is resumable, frames already
+    in the cache are skipped unless `force` is set.
+    Returns the number of frames which failed.
+    """
+    if _cache_path is None:
+        raise ValueError('pre-rendering needs the on-disk cache, set SLT_CACHE_PATH or --cache')
+    from .layouts.image_annotation import render_cache
+
+    image_dataloader = get_image_dataloader()
+    products = select_products(image_dataloader)
+    frames = [i for i in range(len(image_dataloader))
+              if force or frame_key(image_dataloader, i, products) not in render_cache]
+    n_cached = len(image_dataloader) - len(frames)
+    print(f'{len(image_dataloader)} frames in {_data_path}, {n_cached} already rendered', file=out)
+    if not frames:
+        return 0
+
+    jobs = jobs or os.cpu_count()
+    failed = 0
+    start = time.monotonic()
+    with multiprocessing.Pool(jobs, initializer=_init_worker) as pool:
+        for n, (i, error) in enumerate(pool.imap_unordered(_prerender, frames), start=1):
+            if error is not None:
+                failed += 1
+                print(f'\nframe {i} ({image_dataloader.index.timestamp(i)}) failed: {error}', file=out)
+            elapsed = time.monotonic() - start
+            eta = elapsed / n * (len(frames) - n)
+            print(f'\r{n}/{len(frames)} frames rendered, {elapsed:.0f} s elapsed, {eta:.0f} s remaining',
+                  end='' if n < len(frames) else '\n', file=out, flush=True)
+    return failed
@@ -0,0 +1,32 @@
+from datetime import datetime
+import sys
+
+from .store import AnnotationStore
+from .tracking import propagate_sequence
+from .utils import dl2np
+from .utils import select_products
+from .utils import time_passed
+
+from .config import _store_path
+from .config import TRACKING_MARGIN
+from .config import TRACKING_PRODUCT
+from .prerender import get_image_dataloader
+
+
+def propagate(session, start, n_frames, out=sys.stderr):
+    """
+    Propagate shapes of the frame with `start` datetime of the session through the following `n_frames` frames
+
+    Only frames without shapes get the proposed shapes, see `propagate_sequence`.
+    """
+    image_dataloader = get_image_dataloader()
+    product = select_products(image_dataloader, [TRACKING_PRODUCT] if TRACKING_PRODUCT else None)[0]
+
+    def load_image(i):
+        return dl2np(image_dataloader.load(i, [product]))[0]
+
+    start = image_dataloader.index.index(str(datetime.fromisoformat(start)))
+    for frame, n_shapes in propagate_sequence(AnnotationStore(_store_path), image_dataloader, load_image, session,
+                                              start, n_frames, margin=TRACKING_MARGIN,
+                                              shape_timestamp=time_passed()):
+        print(f'{frame}: {n_shapes} shapes proposed', file=out)
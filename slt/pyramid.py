@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+
+TILE_SIZE = 512  # size of tiles in pixels of their level
+
+
+def downsample(data, factor=2):
+    """Downsample images (..., rows, columns, channels) by averaging blocks of factor x factor pixels"""
+    rows, cols = data.shape[-3:-1]
+    n_rows, n_cols = math.ceil(rows / factor), math.ceil(cols / factor)
+    # replicate the edge pixels into the incomplete blocks
+    pad = [(0, 0)] * (data.ndim - 3) + [(0, n_rows * factor - rows), (0, n_cols * factor - cols), (0, 0)]
+    padded = np.pad(data, pad, mode='edge')
+    blocks = padded.reshape(data.shape[:-3] + (n_rows, factor, n_cols, factor, data.shape[-1]))
+    return blocks.mean(axis=(-4, -2)).round().astype(data.dtype)
+
+
+def level_for_pixels(width, height, max_pixels):
+    """Finest pyramid level at which width x height full resolution pixels fit into max_pixels"""
+    level = 0
+    while (width / 2 ** level) * (height / 2 ** level) > max_pixels:
+        level += 1
+    return level
+
+
+def level_coords(size, level):
+    """Full resolution coordinates of pixel centers of a pyramid level"""
+    scale = 2 ** level
+    return np.arange(math.ceil(size / scale)) * scale + (scale - 1) / 2
+
+
+def visible_tiles(shape, level, x_range, y_range):
+    """
+    Tiles (ty, tx) of a pyramid level which intersect the viewport
+
+    `shape` is (rows, columns) of the full resolution image, ranges are in its pixel coordinates.
+    """
+    rows, cols = shape
+    tile = TILE_SIZE * 2 ** level  # tile size in full resolution pixels
+    x0, x1 = sorted(x_range)
+    y0, y1 = sorted(y_range)
+    tx = range(max(int((x0 + 0.5) // tile), 0), min(int((x1 + 0.5) // tile), math.ceil(cols / tile) - 1) + 1)
+    ty = range(max(int((y0 + 0.5) // tile), 0), min(int((y1 + 0.5) // tile), math.ceil(rows / tile) - 1) + 1)
+    return [(j, i) for j in ty for i in tx]
+
+
+def tile_bounds(shape, level, ty, tx):
+    """Full resolution pixel bounds (row0, row1, column0, column1) of tile"""
+    rows, cols = shape
+    tile = TILE_SIZE * 2 ** level
+    return ty * tile, min((ty + 1) * tile, rows), tx * tile, min((tx + 1) * tile, cols)
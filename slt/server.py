@@ -0,0 +1,37 @@
+from gunicorn.app.base import BaseApplication
+
+
+class SltApplication(BaseApplication):
+    """
+    Production server of the application
+
+    Gunicorn settings are given as a dict (e.g. `{'workers': 2, 'worker_class': 'gthread', 'threads': 8}`),
+    settings in GUNICORN_CMD_ARGS environment variable take precedence.
+    """
+
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key.lower(), value)
+        env_args = self.cfg.parser().parse_args(self.cfg.get_cmd_args_from_env())
+        for key, value in vars(env_args).items():
+            if value is not None and key != 'args':
+                self.cfg.set(key.lower(), value)
+
+    def load(self):
+        # imported by the master process when the application is preloaded, by every worker otherwise
+        from .app import create_app
+        from .app import warm_up
+
+        app = create_app()
+        if self.cfg.preload_app:
+            warm_up(app)
+        return app.server
+
+
+def run_server(**options):
+    SltApplication(options).run()
@@ -0,0 +1,90 @@
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import threading
+
+import numpy as np
+
+
+class SharedFrameCache:
+    """
+    Cache of decoded frames shared by processes (e.g. gunicorn workers) as memory-mapped .npy files
+
+    A frame decoded by any process is saved once and all processes map the same file, so its pages are
+    kept just once in the page cache. Placed in shared memory (e.g. /dev/shm) the files are never written to
+    disk. The directory itself is the index: file names are hashes of the keys, least recently used files are
+    removed when the total size exceeds `max_bytes`. The limit is lowered to the space available on the file
+    system of `cache_path`, frames that cannot be saved (e.g. shared memory is full) are just not shared.
+    """
+
+    def __init__(self, cache_path, namespace='', max_bytes=None):
+        self.cache_path = Path(cache_path)
+        self.namespace = namespace
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        available = shutil.disk_usage(self.cache_path).free + self.nbytes()
+        self.max_bytes = available if max_bytes is None else min(max_bytes, available)
+
+    def _file(self, key):
+        digest = hashlib.sha1(f'{self.namespace}:{key}'.encode()).hexdigest()
+        return self.cache_path / f'{digest}.npy'
+
+    def __contains__(self, key):
+        return self._file(key).exists()
+
+    def get(self, key):
+        """Read-only memory map of the cached array or None"""
+        file = self._file(key)
+        try:
+            data = np.load(file, mmap_mode='r')
+            os.utime(file)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return data
+
+    def put(self, key, data):
+        """Save array and return its memory map, the array itself if it cannot be saved"""
+        file = self._file(key)
+        tmp_file = file.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.save(f, np.ascontiguousarray(data))
+            os.replace(tmp_file, file)
+            self.evict()
+            return np.load(file, mmap_mode='r')
+        except OSError:
+            try:
+                os.remove(tmp_file)
+            except FileNotFoundError:
+                pass
+            return np.asarray(data)
+
+    def _files(self):
+        """List of (modification time, size, path) of the cached files"""
+        files = []
+        with os.scandir(self.cache_path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npy'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # removed by another process
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def nbytes(self):
+        """Total size of the cached files"""
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self):
+        """Remove the least recently used files above the size limit, mapped files stay valid for their users"""
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,74 @@
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+
+
+class AnnotationStore:
+    """
+    Annotations persisted in SQLite
+
+    Shapes are stored per annotating session and frame timestamp so that callbacks read and write
+    only the shapes of the frame being annotated. The database may be shared by several workers.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('CREATE TABLE IF NOT EXISTS shapes ('
+                        'session TEXT NOT NULL, '
+                        'frame TEXT NOT NULL, '
+                        'shapes TEXT NOT NULL, '
+                        'PRIMARY KEY (session, frame))')
+
+    def _connection(self):
+        # sqlite connections can be used neither from other threads nor from forked processes
+        con = getattr(self._local, 'connection', None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = con
+            self._local.pid = os.getpid()
+        return con
+
+    def get(self, session, frame):
+        """Shapes of the frame annotated in the session"""
+        row = self._connection().execute(
+            'SELECT shapes FROM shapes WHERE session = ? AND frame = ?', (session, frame)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    def put(self, session, frame, shapes):
+        with self._connection() as con:
+            con.execute('INSERT OR REPLACE INTO shapes (session, frame, shapes) VALUES (?, ?, ?)',
+                        (session, frame, json.dumps(shapes)))
+
+    def frames(self, session):
+        """Iterate over (frame, shapes) annotated in the session ordered by frame timestamp"""
+        rows = self._connection().execute(
+            'SELECT frame, shapes FROM shapes WHERE session = ? ORDER BY frame', (session,)
+        )
+        for frame, shapes in rows:
+            yield frame, json.loads(shapes)
+
+    def annotations(self, session=None, start=None, end=None):
+        """
+        Iterate over (session, frame, shapes) ordered by frame timestamp and session
+
+        Optionally only of the given session and of frames with timestamps in [start, end].
+        """
+        conditions = []
+        params = []
+        for condition, param in (('session = ?', session), ('frame >= ?', start), ('frame <= ?', end)):
+            if param is not None:
+                conditions.append(condition)
+                params.append(param)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        rows = self._connection().execute(
+            f'SELECT session, frame, shapes FROM shapes{where} ORDER BY frame, session', params
+        )
+        for session, frame, shapes in rows:
+            yield session, frame, json.loads(shapes)
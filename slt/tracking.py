@@ -0,0 +1,104 @@
+import uuid
+
+import numpy as np
+
+MAX_WINDOW = 256  # largest matched window in pixels
+# shape attributes derived from the corners, they are left out of the moved shapes
+_derived_keys = {'timestamp', 'x_center', 'y_center', 'lon0', 'lat0', 'lon1', 'lat1', 'lon_center', 'lat_center'}
+
+
+def _windows(image, centers, size):
+    """Square windows (n, size, size) of the image around (row, column) centers, edges are replicated"""
+    half = size // 2
+    padded = np.pad(image, half, mode='edge')
+    offsets = np.arange(size)
+    rows = centers[:, 0, None] + offsets  # shifted by the padding
+    cols = centers[:, 1, None] + offsets
+    return padded[rows[:, :, None], cols[:, None, :]]
+
+
+def track_boxes(image0, image1, boxes, margin=32):
+    """
+    Displacement (dx, dy) of boxes from image0 to image1 found by phase correlation
+
+    `boxes` is (n, 4) array of x0, y0, x1, y1 pixel coordinates (x is the column and y the row of the images),
+    `image0` and `image1` are (rows, columns) or (rows, columns, channels) arrays. Windows around all the boxes
+    are correlated at once, displacements are limited to `margin` pixels.
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros((0, 2))
+    if image0.ndim == 3:
+        image0 = image0.mean(axis=-1)
+        image1 = image1.mean(axis=-1)
+    image0 = image0.astype(np.float32)
+    image1 = image1.astype(np.float32)
+
+    extent = np.abs(boxes[:, 2:] - boxes[:, :2]).max() + 2 * margin
+    size = int(min(2 ** np.ceil(np.log2(max(extent, 8))), MAX_WINDOW))
+    centers = np.stack([(boxes[:, 1] + boxes[:, 3]) / 2, (boxes[:, 0] + boxes[:, 2]) / 2], axis=1)
+    centers = np.clip(np.round(centers).astype(int), 0, np.array(image0.shape) - 1)
+
+    taper = np.outer(np.hanning(size), np.hanning(size)).astype(np.float32)
+    spectra = []
+    for image in (image0, image1):
+        windows = _windows(image, centers, size)
+        windows = windows - windows.mean(axis=(1, 2), keepdims=True)
+        spectra.append(np.fft.rfft2(windows * taper))
+    cross = spectra[1] * np.conj(spectra[0])
+    cross /= np.abs(cross) + 1e-6
+    correlation = np.fft.irfft2(cross, s=(size, size))
+
+    # shifts of the correlation peaks, only the ones within the margin are considered
+    shifts = (np.arange(size) + size // 2) % size - size // 2
+    outside = (np.abs(shifts)[:, None] > margin) | (np.abs(shifts)[None, :] > margin)
+    correlation[:, outside] = -np.inf
+    peaks = correlation.reshape(len(boxes), -1).argmax(axis=1)
+    dy, dx = shifts[peaks // size], shifts[peaks % size]
+    return np.stack([dx, dy], axis=1).astype(float)
+
+
+def propagate_shapes(shapes, image0, image1, margin=32):
+    """
+    Shapes of one frame moved to the next frame by the displacement of the images under them
+
+    The proposed shapes are copies of the given ones with new names, without timestamps and the attributes
+    derived from the corners.
+    """
+    if not shapes:
+        return []
+    boxes = [[float(sh[key]) for key in ['x0', 'y0', 'x1', 'y1']] for sh in shapes]
+    shifts = track_boxes(image0, image1, boxes, margin=margin)
+    proposed = []
+    for sh, (dx, dy) in zip(shapes, shifts):
+        new_shape = {k: v for k, v in sh.items() if k not in _derived_keys}
+        new_shape.update(x0=float(sh['x0']) + dx, x1=float(sh['x1']) + dx,
+                         y0=float(sh['y0']) + dy, y1=float(sh['y1']) + dy, name=uuid.uuid4().hex)
+        proposed.append(new_shape)
+    return proposed
+
+
+def propagate_sequence(annotation_store, image_dataloader, load_image, session, start: int, n_frames: int,
+                       margin=32, shape_timestamp=0):
+    """
+    Propagate shapes of `start` frame of the session through the following `n_frames` frames
+
+    Frames with shapes are kept as they are and their shapes are propagated further. `load_image(i)` returns
+    the image of i-th frame used for matching, the proposed shapes get `shape_timestamp`. Yields (frame, number
+    of proposed shapes) of the changed frames.
+    """
+    from .utils import frame_timestamp
+
+    shapes = annotation_store.get(session, frame_timestamp(image_dataloader, start))
+    image = load_image(start)
+    for i in range(start + 1, min(start + n_frames + 1, len(image_dataloader))):
+        next_image = load_image(i)
+        timestamp = frame_timestamp(image_dataloader, i)
+        next_shapes = annotation_store.get(session, timestamp)
+        if not next_shapes and shapes:
+            next_shapes = propagate_shapes(shapes, image, next_image, margin=margin)
+            for sh in next_shapes:
+                sh['timestamp'] = shape_timestamp
+            annotation_store.put(session, timestamp, next_shapes)
+            yield timestamp, len(next_shapes)
+        shapes, image = next_shapes, next_image
@@ -2,6 +2,7 @@ import numpy as np
 import time
 
 from .config import DEBUG
+from .config import DEFAULT_PRODUCTS
 
 
 def time_passed(start=0):
@@ -13,17 +14,32 @@ def frame_timestamp(image_dataloader, i: int) -> str:
     return str(image_dataloader.attrs[i]['datetime'])
 
 
+def select_products(image_dataloader, products=None):
+    """Products to display in the order of the dataset, all of them if none (or none existing) is selected"""
+    products = products or DEFAULT_PRODUCTS
+    available = image_dataloader.products
+    selected = [p for p in available if products is None or p in products]
+    return selected or available
+
+
+def frame_key(image_dataloader, i: int, products) -> str:
+    """Key of i-th frame with the given products in the frame caches"""
+    return f'{frame_timestamp(image_dataloader, i)}/{"+".join(products)}'
+
+
 def debug_print(*args):
     if DEBUG:
         print(*args)
 
 
 def dl2np(dl):
-    """Create numpy array from list of xr.DataArrays"""
-    data = np.stack([np.moveaxis(da.values, 0, -1) for da in dl])
-
-    data = data[:, ::-1, :]
-    lat = dl[0].lat
-    lon = dl[1].lon
-
-    return data, lat, lon
+    """
+    Create numpy array (images, rows, columns, channels) from list of xr.DataArrays (channels, rows, columns)
+
+    The images are flipped upside down while they are copied into the array.
+    """
+    channels, rows, cols = dl[0].shape
+    data = np.empty((len(dl), rows, cols, channels), dtype=dl[0].dtype)
+    for k in range(len(dl)):
+        data[k] = np.moveaxis(dl[k].values, 0, -1)[::-1]
+    return data
@@ -0,0 +1,53 @@
+from slt.cache import FrameRenderCache
+from slt.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.get('b') is None
+
+
+def test_lru_cache_byte_limit():
+    cache = LRUCache(maxsize=None, max_bytes=10, sizeof=len)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.get('a') == b'1234'
+    cache.put('c', b'1234')
+    assert cache.nbytes == 8
+    assert cache.get('b') is None
+    # the most recent item is kept even if it is too large
+    cache.put('d', b'0123456789ab')
+    assert list(cache._data) == ['d']
+    assert cache.nbytes == 12
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 3)
+
+
+def test_frame_render_cache_on_disk(tmp_path):
+    fig = {'data': [{'type': 'image', 'source': 'data:image/png;base64,AAAA'}], 'layout': {}}
+    cache = FrameRenderCache(maxsize=1, cache_path=tmp_path, namespace='images')
+    cache.put('2021-08-20 12:00:00', fig)
+
+    other = FrameRenderCache(maxsize=1, cache_path=tmp_path, namespace='images')
+    assert '2021-08-20 12:00:00' in other
+    assert other.get('2021-08-20 12:00:00') == fig
+    assert other.get('2021-08-20 12:15:00') is None
+
+    other_dataset = FrameRenderCache(maxsize=1, cache_path=tmp_path, namespace='other images')
+    assert other_dataset.get('2021-08-20 12:00:00') is None
+
+
+def test_frame_render_cache_byte_limit():
+    cache = FrameRenderCache(maxsize=None, max_bytes=10, sizeof=lambda sources: sum(map(len, sources)))
+    cache.put('a', ['1234', '5'])
+    cache.put('b', ['1234'])
+    cache.put('c', ['12'])
+    assert cache.get('a') is None
+    assert (cache.get('b'), cache.get('c')) == (['1234'], ['12'])
+    assert (cache.memory.nbytes, cache.memory.evictions) == (6, 1)
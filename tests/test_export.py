@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('flask')
+pytest.importorskip('plotly')  # needed by the configuration
+
+from slt.export import csv_chunks, export_columns, jsonl_chunks, parquet_chunks  # noqa: E402
+from slt.export import register_export_route  # noqa: E402
+from slt.georef import Georeferencer  # noqa: E402
+from slt.store import AnnotationStore  # noqa: E402
+
+
+def make_row(label, x0):
+    row = {col: float(n) for n, col in enumerate(export_columns)}
+    row.update(session='s', datetime='2021-08-20 12:00:00', annotator='me', label=label, x0=x0)
+    return row
+
+
+frame_rows = [[make_row('Cold ring', 1.5), make_row('Cold U/V', 2.5)], [make_row('Cold ring', 3.5)]]
+
+
+def test_jsonl_chunks():
+    lines = ''.join(jsonl_chunks(frame_rows)).splitlines()
+    assert [json.loads(line) for line in lines] == [row for rows in frame_rows for row in rows]
+
+
+def test_csv_chunks():
+    content = ''.join(csv_chunks(frame_rows))
+    assert content.splitlines()[0] == ','.join(export_columns)
+    rows = list(csv.DictReader(io.StringIO(content)))
+    assert [row['label'] for row in rows] == ['Cold ring', 'Cold U/V', 'Cold ring']
+    assert [float(row['x0']) for row in rows] == [1.5, 2.5, 3.5]
+
+
+def test_parquet_chunks():
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    table = pq.read_table(io.BytesIO(b''.join(parquet_chunks(frame_rows))))
+    assert table.column_names == export_columns
+    assert table.column('x0').to_pylist() == [1.5, 2.5, 3.5]
+
+
+@pytest.fixture
+def client(tmp_path):
+    dash = pytest.importorskip('dash')
+
+    app = dash.Dash(__name__)
+    app.layout = dash.html.Div()
+    store = AnnotationStore(tmp_path / 'annotations.sqlite')
+    shape = {'x0': 0, 'y0': 0, 'x1': 2, 'y1': 1, 'annotator': 'me', 'label': 'Cold ring'}
+    store.put('s', '2021-08-20 12:00:00', [shape])
+    store.put('s', '2021-08-20 12:15:00', [dict(shape, label='Cold U/V')])
+    lat = np.array([[50., 50., 50.], [49., 49., 49.]])
+    lon = np.array([[10., 11., 12.], [10., 11., 12.]])
+    register_export_route(app, store, Georeferencer(lat, lon))
+    return app.server.test_client()
+
+
+def test_export_route(client):
+    response = client.get('/export/annotations.jsonl?start=2021-08-20T12:10')
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(row['datetime'], row['label']) for row in rows] == [('2021-08-20 12:15:00', 'Cold U/V')]
+    assert (rows[0]['lon1'], rows[0]['lat1'], rows[0]['lon_center']) == (12., 49., 11.)
+
+
+def test_export_route_errors(client):
+    assert client.get('/export/annotations.jsonl?start=yesterday').status_code == 400
+    assert client.get('/export/annotations.xlsx').status_code == 404
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip('trollsift')
+
+from slt.frame_index import FrameIndex  # noqa: E402
+
+file_mask = '{projection}-{resolution}.{product}.{datetime:%Y%m%d.%H%M}.0.jpg'
+
+
+def touch(path, *names):
+    for name in names:
+        (path / name).write_bytes(b'')
+
+
+def test_frame_index(tmp_path):
+    data_path = tmp_path / 'images'
+    data_path.mkdir()
+    touch(data_path,
+          'msgce-1160x800.storm.20210820.1215.0.jpg',
+          'msgce-1160x800.ir108BT.20210820.1215.0.jpg',
+          'msgce-1160x800.storm.20210820.1200.0.jpg',
+          'georef.tif')
+
+    index = FrameIndex(data_path, file_mask, tmp_path / 'index.sqlite')
+    assert len(index) == 2
+    assert index.timestamp(0) == '2021-08-20 12:00:00'
+    assert index.index('2021-08-20 12:15:00') == 1
+    assert index.nearest('2021-08-20 12:05:00') == 0
+    assert index.nearest('2021-08-20 12:10') == 1
+    assert index.nearest('2021-08-21') == 1
+    assert index.files(1) == [('msgce-1160x800.ir108BT.20210820.1215.0.jpg', 'ir108BT'),
+                              ('msgce-1160x800.storm.20210820.1215.0.jpg', 'storm')]
+    assert index.file('msgce-1160x800.storm.20210820.1200.0.jpg')[:2] == ('2021-08-20 12:00:00', 'storm')
+    assert index.file('georef.tif') is None
+    assert index.products() == ['ir108BT', 'storm']
+    with pytest.raises(IndexError):
+        index.timestamp(2)
+
+    touch(data_path, 'msgce-1160x800.storm.20210820.1145.0.jpg')
+    (data_path / 'msgce-1160x800.storm.20210820.1200.0.jpg').unlink()
+    index = FrameIndex(data_path, file_mask, tmp_path / 'index.sqlite')
+    assert len(index) == 2
+    assert index.timestamp(0) == '2021-08-20 11:45:00'
+    assert index.timestamp(1) == '2021-08-20 12:15:00'
+    # products are read from the index when nothing has changed
+    assert FrameIndex(data_path, file_mask, tmp_path / 'index.sqlite').products() == ['ir108BT', 'storm']
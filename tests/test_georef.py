@@ -0,0 +1,77 @@
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from slt.georef import Georeferencer  # noqa: E402
+
+
+def test_lonlat_bilinear():
+    lat = np.array([[50., 50., 50.], [49., 49., 49.]])
+    lon = np.array([[10., 11., 12.], [10., 11., 12.]])
+    georeferencer = Georeferencer(lat, lon)
+
+    lon_i, lat_i = georeferencer.lonlat([0, 1.5, 2], [0, 0.25, 1])
+    np.testing.assert_allclose(lon_i, [10., 11.5, 12.])
+    np.testing.assert_allclose(lat_i, [50., 49.75, 49.])
+
+
+def test_lonlat_outside_of_grid_is_clipped():
+    lat = np.array([[50., 50.], [49., 49.]])
+    lon = np.array([[10., 11.], [10., 11.]])
+    georeferencer = Georeferencer(lat, lon)
+
+    lon_i, lat_i = georeferencer.lonlat(np.array([[-5., 7.]]), np.array([[3., -1.]]))
+    assert lon_i.shape == (1, 2)
+    np.testing.assert_allclose(lon_i, [[10., 11.]])
+    np.testing.assert_allclose(lat_i, [[49., 50.]])
+
+
+def test_georeferencer_needs_grids():
+    with pytest.raises(ValueError):
+        Georeferencer()
+
+
+def test_browser_grids():
+    import gzip
+
+    lat, lon = np.meshgrid(np.linspace(50, 40, 5), np.linspace(10, 20, 7), indexing='ij')
+    content, version = Georeferencer(lat, lon).browser_grids(max_points=12)
+    data = gzip.decompress(content)
+    header = np.frombuffer(data[:16], dtype='<i4')
+    assert header.tolist() == [5, 7, 2, 4]
+    grids = np.frombuffer(data[16:], dtype='<f4').reshape(2, 2, 4)
+    # the edges are kept
+    np.testing.assert_allclose(grids[0], np.meshgrid(np.linspace(10, 20, 4), np.zeros(2))[0])
+    np.testing.assert_allclose(grids[1, :, 0], [50, 40])
+    assert Georeferencer(lat, lon).browser_grids(max_points=12)[1] == version
+
+
+def test_sidecars(tmp_path, monkeypatch):
+    import types
+
+    from slt.georef import _read_georef, _sidecars, load_lonlat_grids, load_projection
+
+    lat = np.array([[50., 50.], [49., 49.]])
+    lon = np.array([[10., 11.], [10., 11.]])
+    georef = types.SimpleNamespace(lat=lat, lon=lon, attrs={'crs': 'EPSG:4326'})
+    reads = []
+    utils = types.SimpleNamespace(image2xr=lambda path: reads.append(path) or georef)
+    monkeypatch.setitem(sys.modules, 'satdl', types.SimpleNamespace(utils=utils))
+
+    geo_path = tmp_path / 'georef.tif'
+    geo_path.write_bytes(b'')
+    old_sidecar = tmp_path / 'georef.tif.1-1.lonlat.npy'
+    old_sidecar.write_bytes(b'')
+    np.testing.assert_array_equal(load_lonlat_grids(geo_path), [lon, lat])
+    assert not old_sidecar.exists()
+    assert load_projection(geo_path) == 'EPSG:4326'
+    assert len(reads) == 1
+
+    # the current sidecars are not removed when another process reads the georeference again
+    unlinked = []
+    monkeypatch.setattr(type(geo_path), 'unlink', lambda path: unlinked.append(path))
+    _read_georef(geo_path)
+    assert unlinked == []
+    assert all(path.exists() for path in _sidecars(geo_path))
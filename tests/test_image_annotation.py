@@ -0,0 +1,76 @@
+import types
+
+import pytest
+
+for module in ('numpy', 'plotly', 'dash', 'dash_bootstrap_components', 'PIL', 'trollsift'):
+    pytest.importorskip(module)
+
+import numpy as np  # noqa: E402
+
+from slt.layouts.image_annotation import fig_nbytes, get_frame_data, match_stored_shapes  # noqa: E402
+from slt.utils import dl2np, time_passed  # noqa: E402
+
+
+def shape(x0, name=None, timestamp=None):
+    sh = {'x0': x0, 'y0': 1., 'x1': x0 + 10, 'y1': 11., 'line': {'color': '#FD3216'}, 'name': name}
+    if timestamp is not None:
+        sh['timestamp'] = timestamp
+    return sh
+
+
+def test_match_stored_shapes():
+    stored = [shape(1., name='moved', timestamp=3), shape(20., timestamp=5)]
+    starttime = time_passed() - 100
+    shapes = match_stored_shapes([shape(2.5, name='moved'), shape(20.), shape(40., name='new')], stored, starttime)
+
+    # matched by id although the corners moved
+    assert (shapes[0]['name'], shapes[0]['timestamp']) == ('moved', 3)
+    # stored shape without id matched by the corners and color, it gets a name
+    assert shapes[1]['timestamp'] == 5
+    assert shapes[1]['name']
+    # new shapes get the current time, a new name if they have none
+    assert shapes[2]['name'] == 'new'
+    assert shapes[2]['timestamp'] >= 100
+    unnamed = match_stored_shapes([shape(60.)], stored, starttime)[0]
+    assert unnamed['timestamp'] >= 100
+    assert unnamed['name'] not in {'moved', 'new', shapes[1]['name']}
+
+
+class Images:
+    """Dataset of one frame of images (channels, rows, columns) given by product as loaded by satdl"""
+
+    def __init__(self, timestamp, images):
+        self.attrs = [{'datetime': timestamp}]
+        self.images = images
+
+    def load(self, i, products):
+        return [types.SimpleNamespace(shape=self.images[p].shape, dtype=self.images[p].dtype, values=self.images[p])
+                for p in products]
+
+
+def test_dl2np_flips_images():
+    dataset = Images('dl2np', {'a': np.arange(12, dtype=np.uint8).reshape(2, 2, 3)})
+    data = dl2np(dataset.load(0, ['a', 'a']))
+    assert data.shape == (2, 2, 3, 2)
+    # rows are flipped upside down, channels are the last axis
+    np.testing.assert_array_equal(data[1, :, :, 0], [[3, 4, 5], [0, 1, 2]])
+    np.testing.assert_array_equal(data[1, 0, 0], [3, 9])
+
+
+def test_get_frame_data_keeps_product_order():
+    products = ['a', 'b', 'c']
+    images = {p: np.full((1, 2, 3), n, dtype=np.uint8) for n, p in enumerate(products)}
+    images['a'][0, 0] = 7  # the first row
+    dataset = Images('test_get_frame_data_keeps_product_order', images)
+    data = get_frame_data(dataset, 0, ['c', 'a', 'b'])
+    assert data.shape == (3, 2, 3, 1)
+    assert data[:, 0, 0, 0].tolist() == [2, 0, 1]
+    assert data[1, :, 0, 0].tolist() == [0, 7]
+    np.testing.assert_array_equal(get_frame_data(dataset, 0, ['b']), data[2:])
+
+
+def test_fig_nbytes():
+    fig = {'data': [{'type': 'image', 'source': 'data:image/png;base64,AAAA'}, {'type': 'scatter'}],
+           'layout': {'images': [{'source': 'data:image/jpeg;base64,AA'}]}}
+    assert fig_nbytes(fig) == len('data:image/png;base64,AAAA') + len('data:image/jpeg;base64,AA')
+    assert fig_nbytes({'data': [], 'layout': {}}) == 0
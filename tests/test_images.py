@@ -0,0 +1,36 @@
+import io
+
+import pytest
+
+np = pytest.importorskip('numpy')
+Image = pytest.importorskip('PIL.Image')
+
+from slt.images import encode_image, passthrough_type, to_data_uri  # noqa: E402
+
+
+def decode(content):
+    return np.array(Image.open(io.BytesIO(content)))
+
+
+def test_encode_image():
+    data = np.random.default_rng(0).integers(0, 256, (6, 5, 3), dtype=np.uint8)
+    assert (decode(encode_image(data)) == data).all()
+    # single channel images are encoded as grayscale
+    assert decode(encode_image(data[..., :1])).shape == (6, 5)
+    # JPEG drops the alpha channel
+    rgba = np.concatenate([data, np.full((6, 5, 1), 255, dtype=np.uint8)], axis=-1)
+    assert decode(encode_image(rgba, 'jpeg', quality=50)).shape == (6, 5, 3)
+    assert decode(encode_image(data[::-1], 'webp')).shape == (6, 5, 3)
+
+
+def test_passthrough_type():
+    assert passthrough_type('msgce-1160x800.storm.20210820.1215.0.jpg') == 'image/jpeg'
+    assert passthrough_type('georef.tif') is None
+    assert to_data_uri(b'abc', 'image/png') == 'data:image/png;base64,YWJj'
+
+
+def test_image_size(tmp_path):
+    from slt.images import image_size
+
+    Image.fromarray(np.zeros((3, 5, 3), dtype=np.uint8)).save(tmp_path / 'image.jpg')
+    assert image_size(tmp_path / 'image.jpg') == (3, 5)
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip('flask')
+
+from slt.metrics import Metrics  # noqa: E402
+
+
+def test_metrics_render():
+    metrics = Metrics(buckets=(0.1, 1))
+    metrics.describe('requests_total', 'counter', 'Requests')
+    metrics.inc('requests_total', callback='graph.figure')
+    metrics.inc('requests_total', 2, callback='graph.figure')
+    metrics.observe('duration_seconds', 0.5, callback='a"b')
+
+    assert metrics.get('requests_total', callback='graph.figure') == 3
+    assert metrics.render().splitlines() == [
+        'duration_seconds_bucket{callback="a\\"b",le="0.1"} 0',
+        'duration_seconds_bucket{callback="a\\"b",le="1"} 1',
+        'duration_seconds_bucket{callback="a\\"b",le="+Inf"} 1',
+        'duration_seconds_sum{callback="a\\"b"} 0.5',
+        'duration_seconds_count{callback="a\\"b"} 1',
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{callback="graph.figure"} 3',
+    ]
+
+
+def test_metrics_collectors():
+    metrics = Metrics()
+    metrics.collect(lambda m: m.set('cache_bytes', 42, cache='decoded'))
+    assert metrics.render() == 'cache_bytes{cache="decoded"} 42\n'
+    assert metrics.get('cache_bytes', cache='decoded') == 42
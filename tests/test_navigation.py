@@ -0,0 +1,45 @@
+import pytest
+
+from slt.navigation import LatestRequests
+
+
+def test_latest_requests():
+    requests = LatestRequests()
+    assert not requests.superseded('a', 1)
+    requests.put('a', 2)
+    requests.put('a', 1)  # an older request arriving late does not lower the latest one
+    assert requests.superseded('a', 1)
+    assert not requests.superseded('a', 2)
+    assert not requests.superseded('a', None)
+    assert not requests.superseded('b', 1)
+
+
+@pytest.fixture
+def image_dataloader(tmp_path):
+    for module in ('trollsift', 'numpy', 'plotly', 'dash', 'dash_bootstrap_components', 'PIL'):
+        pytest.importorskip(module)
+    from slt.datasets import IndexedImageDataset
+
+    data_path = tmp_path / 'images'
+    data_path.mkdir()
+    for frame in ('1200', '1215', '1230'):
+        (data_path / f'msgce-1160x800.storm.20210820.{frame}.0.jpg').write_bytes(b'')
+    return IndexedImageDataset(data_path, '{projection}-{resolution}.{product}.{datetime:%Y%m%d.%H%M}.0.jpg',
+                               tmp_path / 'index.sqlite')
+
+
+def test_requested_frame(image_dataloader):
+    from slt.layouts.annotation_table import requested_frame
+
+    assert requested_frame(image_dataloader, None) is None
+    assert requested_frame(image_dataloader, {'current': 4, 'request': 1}) == 1
+    # numbers count from 1 and are clamped to the frames
+    assert requested_frame(image_dataloader, {'jump': ' 2 '}) == 1
+    assert requested_frame(image_dataloader, {'jump': '0'}) == 0
+    assert requested_frame(image_dataloader, {'jump': '99'}) == 2
+    # datetimes go to the nearest frame
+    assert requested_frame(image_dataloader, {'jump': '2021-08-20 12:20'}) == 1
+    assert requested_frame(image_dataloader, {'jump': '2021-08-20T12:29:59'}) == 2
+    assert requested_frame(image_dataloader, {'jump': '2022-01-01'}) == 2
+    assert requested_frame(image_dataloader, {'jump': 'tomorrow'}) is None
+    assert requested_frame(image_dataloader, {'jump': '-1'}) is None
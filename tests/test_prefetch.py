@@ -0,0 +1,35 @@
+import threading
+
+import pytest
+
+# slt.prefetch reports failures through slt.utils, which needs the configuration
+pytest.importorskip('numpy')
+pytest.importorskip('plotly')
+
+from slt.prefetch import FramePrefetcher  # noqa: E402
+
+
+def test_neighbours():
+    assert FramePrefetcher(None, 10, window=2).neighbours(0) == [1, 9, 2, 8]
+    # frames are not repeated in short sequences
+    assert FramePrefetcher(None, 4, window=3).neighbours(0) == [1, 3, 2]
+
+
+def test_schedule_cancels_superseded_prefetch():
+    started, release = threading.Event(), threading.Event()
+    warmed = []
+
+    def warm(i, products):
+        warmed.append((i, products))
+        started.set()
+        release.wait(5)
+
+    prefetcher = FramePrefetcher(warm, 10, window=1, max_workers=1)
+    prefetcher.schedule(5, 'storm')
+    started.wait(5)
+    # frame 6 is being warmed, frame 4 is waiting and out of the new window
+    prefetcher.schedule(8, 'storm')
+    release.set()
+    prefetcher._executor.shutdown(wait=True)
+    assert warmed == [(6, 'storm'), (9, 'storm'), (7, 'storm')]
+    assert prefetcher._pending == {}
@@ -0,0 +1,31 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from slt.pyramid import downsample, level_coords, level_for_pixels, tile_bounds, visible_tiles, TILE_SIZE  # noqa: E402
+
+
+def test_downsample_pads_odd_edges():
+    data = np.arange(15, dtype=np.uint8).reshape(3, 5, 1)
+    small = downsample(data)
+    assert small.shape == (2, 3, 1)
+    assert small.dtype == np.uint8
+    assert small[0, 0, 0] == 3  # mean of 0, 1, 5, 6
+    assert small[1, 2, 0] == 14  # the corner pixel replicated
+
+
+def test_level_for_pixels():
+    assert level_for_pixels(1000, 1000, 1024 ** 2) == 0
+    assert level_for_pixels(4000, 3000, 1024 ** 2) == 2
+
+
+def test_level_coords_are_block_centers():
+    np.testing.assert_allclose(level_coords(5, 1), [0.5, 2.5, 4.5])
+
+
+def test_visible_tiles():
+    shape = (3 * TILE_SIZE, 3 * TILE_SIZE + 10)
+    assert visible_tiles(shape, 0, [TILE_SIZE + 10, 10], [-0.5, 20]) == [(0, 0), (0, 1)]
+    assert visible_tiles(shape, 0, [-100, 1e6], [2 * TILE_SIZE, 1e6]) == [(2, tx) for tx in range(4)]
+    assert visible_tiles(shape, 1, [-0.5, 1e6], [-0.5, 1e6]) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert tile_bounds(shape, 0, 2, 3) == (2 * TILE_SIZE, 3 * TILE_SIZE, 3 * TILE_SIZE, 3 * TILE_SIZE + 10)
@@ -0,0 +1,58 @@
+import os
+import shutil
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from slt.shared_cache import SharedFrameCache  # noqa: E402
+
+
+def test_shared_frame_cache_reopened(tmp_path):
+    data = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    cache = SharedFrameCache(tmp_path, namespace='images')
+    np.testing.assert_array_equal(cache.put('2021-08-20 12:00:00', data), data)
+
+    other = SharedFrameCache(tmp_path, namespace='images')
+    assert '2021-08-20 12:00:00' in other
+    cached = other.get('2021-08-20 12:00:00')
+    np.testing.assert_array_equal(cached, data)
+    assert not cached.flags.writeable
+    assert other.get('2021-08-20 12:15:00') is None
+    assert SharedFrameCache(tmp_path, namespace='other images').get('2021-08-20 12:00:00') is None
+
+
+def test_shared_frame_cache_evicts_least_recently_used(tmp_path):
+    data = np.zeros(1000, dtype=np.uint8)
+    cache = SharedFrameCache(tmp_path, max_bytes=2500)
+    cache.put('a', data)
+    cache.put('b', data)
+    file_size = cache._file('a').stat().st_size
+    assert sum(file.stat().st_size for file in tmp_path.glob('*.npy')) == 2 * file_size
+
+    os.utime(cache._file('a'), (1, 1))
+    os.utime(cache._file('b'), (2, 2))
+    assert cache.get('a') is not None  # a is now the most recently used
+    cache.put('c', data)
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert sum(file.stat().st_size for file in tmp_path.glob('*.npy')) == 2 * file_size <= 2500
+
+
+def test_shared_frame_cache_limited_by_free_space(tmp_path, monkeypatch):
+    usage = shutil.disk_usage(tmp_path)._replace(free=1000)
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: usage)
+    assert SharedFrameCache(tmp_path, max_bytes=2 * 1024 ** 3).max_bytes == 1000
+
+
+def test_shared_frame_cache_put_fails(tmp_path, monkeypatch):
+    def save(file, data):
+        file.write(b'partial')
+        raise OSError(28, 'No space left on device')
+
+    data = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    cache = SharedFrameCache(tmp_path)
+    monkeypatch.setattr(np, 'save', save)
+    np.testing.assert_array_equal(cache.put('a', data), data)
+    assert 'a' not in cache
+    assert list(tmp_path.iterdir()) == []
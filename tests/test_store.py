@@ -0,0 +1,32 @@
+from slt.store import AnnotationStore
+
+
+def test_store_per_frame(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.sqlite')
+    shapes = [{'x0': 1.0, 'y0': 2.0, 'x1': 3.0, 'y1': 4.0, 'label': 'Cold ring'}]
+
+    assert store.get('session', '2021-08-20 12:00:00') == []
+    store.put('session', '2021-08-20 12:15:00', shapes)
+    store.put('session', '2021-08-20 12:00:00', [])
+    store.put('other session', '2021-08-20 12:00:00', shapes)
+
+    assert store.get('session', '2021-08-20 12:15:00') == shapes
+    assert list(store.frames('session')) == [('2021-08-20 12:00:00', []), ('2021-08-20 12:15:00', shapes)]
+
+    store.put('session', '2021-08-20 12:15:00', [])
+    assert AnnotationStore(tmp_path / 'annotations.sqlite').get('session', '2021-08-20 12:15:00') == []
+
+
+def test_store_annotations_filter(tmp_path):
+    store = AnnotationStore(tmp_path / 'annotations.sqlite')
+    for session in ('a', 'b'):
+        for frame in ('2021-08-20 12:00:00', '2021-08-20 12:15:00', '2021-08-20 12:30:00'):
+            store.put(session, frame, [{'session': session}])
+
+    assert len(list(store.annotations())) == 6
+    assert [(s, f) for s, f, _ in store.annotations(session='b', start='2021-08-20 12:15:00')] == [
+        ('b', '2021-08-20 12:15:00'), ('b', '2021-08-20 12:30:00')
+    ]
+    assert [(s, f) for s, f, _ in store.annotations(end='2021-08-20 12:00:00')] == [
+        ('a', '2021-08-20 12:00:00'), ('b', '2021-08-20 12:00:00')
+    ]
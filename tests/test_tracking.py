@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from slt.tracking import propagate_shapes, track_boxes  # noqa: E402
+
+
+def _clouds(shape=(300, 400), seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.random(shape)
+    # smooth the noise a bit so that it looks like cloud texture
+    for axis in (0, 1):
+        image = (image + np.roll(image, 1, axis=axis) + np.roll(image, -1, axis=axis)) / 3
+    return (image * 255).astype(np.uint8)
+
+
+def test_track_boxes_finds_shift():
+    image0 = _clouds()
+    image1 = np.roll(image0, (5, -9), axis=(0, 1))
+    shifts = track_boxes(image0, image1, [[100, 100, 140, 130], [250, 150, 260, 170]], margin=16)
+    np.testing.assert_array_equal(shifts, [[-9, 5], [-9, 5]])
+
+
+def test_track_boxes_no_boxes():
+    assert track_boxes(_clouds(), _clouds(), []).shape == (0, 2)
+
+
+def test_propagate_shapes_moves_copies():
+    image0 = _clouds()[..., None].repeat(3, axis=-1)
+    image1 = np.roll(image0, (-3, 4), axis=(0, 1))
+    shape = {'x0': 100, 'y0': 120, 'x1': 130, 'y1': 150, 'name': 'a', 'timestamp': 10, 'label': 'Cold ring'}
+    proposed, = propagate_shapes([shape], image0, image1)
+    assert (proposed['x0'], proposed['y0'], proposed['x1'], proposed['y1']) == (104, 117, 134, 147)
+    assert proposed['label'] == 'Cold ring'
+    assert proposed['name'] != 'a' and 'timestamp' not in proposed